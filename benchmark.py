@@ -0,0 +1,300 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from race_env import CyberRacingEnv
+from track import Track, TRACK_POINTS, smooth_track_points
+from track_library import load_track, track_spec
+from vec_race_env import VectorCyberRacingEnv
+
+# Настройки
+BASELINE_PATH = "benchmarks/baseline.json"  # Сохраненный эталон для проверки регрессий
+TOLERANCE = 0.25       # Допустимое падение скорости относительно эталона (25%)
+# Поля machine, которые должны совпадать с эталоном, чтобы сравнение что-то значило
+MACHINE_KEYS = ("cpu_count", "platform", "python", "numpy")
+# Для скольких процессов мерить сквозное обучение PPO: 1, 2, 4, ... и само число ядер
+PPO_WORKERS = sorted({2 ** k for k in range((os.cpu_count() or 1).bit_length())} | {os.cpu_count() or 1})
+PPO_STEPS = 4096       # Шагов среды на замер PPO (на каждый вариант)
+VEC_ENVS = 1024        # Машин в пачке для VectorCyberRacingEnv
+
+
+def measure(fn, repeat, warmup=10):
+    """Вызывает fn repeat раз, замеряя каждый вызов. Возвращает задержки в микросекундах."""
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    clock = time.perf_counter_ns
+    for i in range(repeat):
+        start = clock()
+        fn()
+        times[i] = clock() - start
+    return times / 1000.0
+
+
+def summarize(times_us, items=1):
+    """Операций в секунду и перцентили задержки. items - сколько шагов среды в одном вызове."""
+    return {
+        "ops_per_sec": float(items * len(times_us) / (times_us.sum() / 1e6)),
+        "p50_us": float(np.percentile(times_us, 50)),
+        "p90_us": float(np.percentile(times_us, 90)),
+        "p99_us": float(np.percentile(times_us, 99)),
+        "n": int(len(times_us)),
+    }
+
+
+def driving_actions(count, seed=0):
+    # Фиксированная последовательность действий: газ в основном вперед, руль случайный
+    rng = np.random.default_rng(seed)
+    actions = rng.uniform(-1, 1, (count, 2))
+    actions[:, 1] = np.abs(actions[:, 1]) * 0.6
+    return actions
+
+
+def bench_env_step(repeat, **env_kwargs):
+    env = CyberRacingEnv(**env_kwargs)
+    env.reset(seed=0)
+    times = np.empty(repeat)
+    for i, action in enumerate(driving_actions(repeat)):
+        start = time.perf_counter_ns()
+        _, _, terminated, _, _ = env.step(action)
+        times[i] = time.perf_counter_ns() - start
+        if terminated:
+            env.reset()  # Сброс не входит в замер шага
+    return summarize(times / 1000.0, env_kwargs.get("action_repeat", 1))
+
+
+def bench_get_obs(repeat, lidar="field"):
+    env = CyberRacingEnv(lidar=lidar)
+    env.reset(seed=0)
+    for action in driving_actions(20):
+        env.step(action)
+    return summarize(measure(env._get_obs, repeat))
+
+
+def bench_reset(repeat):
+    env = CyberRacingEnv()
+    return summarize(measure(env.reset, repeat))
+
+
+def bench_state(repeat, restore=False):
+    env = CyberRacingEnv()
+    env.reset(seed=0)
+    for action in driving_actions(20):
+        env.step(action)
+    state = env.get_state()
+    return summarize(measure(lambda: env.set_state(state) if restore else env.get_state(), repeat))
+
+
+def bench_render(repeat):
+    env = CyberRacingEnv(render_mode="rgb_array")
+    env.reset(seed=0)
+    env.render()  # Первый кадр - полный (фон целиком), дальше только грязные прямоугольники
+    times = np.empty(repeat)
+    for i, action in enumerate(driving_actions(repeat)):
+        # Шаг среды не входит в замер, только кадр
+        _, _, terminated, _, _ = env.step(action)
+        if terminated:
+            env.reset()
+        start = time.perf_counter_ns()
+        env.render()
+        times[i] = time.perf_counter_ns() - start
+    env.close()
+    return summarize(times / 1000.0)
+
+
+def bench_smooth(repeat):
+    return summarize(measure(lambda: smooth_track_points(TRACK_POINTS, smoothness=30), repeat))
+
+
+def bench_track_compile(repeat):
+    # Раньше это был _generate_map: сглаживание + растеризация маски + поле расстояний
+    return summarize(measure(Track, repeat, warmup=1))
+
+
+def bench_track_load(repeat):
+    spec = track_spec(TRACK_POINTS)
+    load_track(spec)  # Убеждаемся, что трасса уже в кэше
+    return summarize(measure(lambda: load_track(spec), repeat))
+
+
+def bench_vec_step(repeat, num_envs=VEC_ENVS, **env_kwargs):
+    env = VectorCyberRacingEnv(num_envs, **env_kwargs)
+    env.reset()
+    actions = driving_actions(num_envs)
+    return summarize(measure(lambda: env.step(actions), repeat, warmup=3),
+                     num_envs * env_kwargs.get("action_repeat", 1))
+
+
+def bench_traffic_step(repeat, num_envs=VEC_ENVS):
+    # Машины мешают друг другу: столкновения и лидар по машинам через пространственный хэш
+    from traffic import TrafficRacingEnv
+
+    env = TrafficRacingEnv(num_envs)
+    env.reset()
+    actions = driving_actions(num_envs)
+    return summarize(measure(lambda: env.step(actions), repeat, warmup=3), num_envs)
+
+
+def bench_ppo(workers, total_steps=PPO_STEPS):
+    """Сквозное обучение PPO: шагов среды в секунду вместе с обновлениями сети."""
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.env_util import make_vec_env
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+    if workers == "vec":
+        env = VectorCyberRacingEnv(64)
+        n_envs = 64
+    else:
+        start_method = "fork" if sys.platform.startswith("linux") else None
+        vec_cls = SubprocVecEnv if workers > 1 else DummyVecEnv
+        vec_kwargs = {"start_method": start_method} if workers > 1 else None
+        env = make_vec_env(CyberRacingEnv, n_envs=workers, vec_env_cls=vec_cls, vec_env_kwargs=vec_kwargs)
+        n_envs = workers
+    n_steps = max(total_steps // n_envs // 4, 16)
+    model = PPO("MlpPolicy", env, n_steps=n_steps, batch_size=min(256, n_steps * n_envs),
+                n_epochs=4, device="cpu", verbose=0, seed=0)
+    model.learn(total_timesteps=n_steps * n_envs)  # Разогрев (процессы, torch)
+    rollout = n_steps * n_envs
+    start = time.perf_counter()
+    model.learn(total_timesteps=total_steps, reset_num_timesteps=False)
+    elapsed = time.perf_counter() - start
+    done_steps = -(-total_steps // rollout) * rollout  # learn доигрывает rollout до конца
+    env.close()
+    return {"ops_per_sec": done_steps / elapsed, "seconds": elapsed, "n": done_steps}
+
+
+def run_benchmarks(quick=False, only=None, ppo_workers=PPO_WORKERS):
+    scale = 0.2 if quick else 1.0
+
+    def n(count):
+        return max(int(count * scale), 20)
+
+    benchmarks = {
+        "env_step": lambda: bench_env_step(n(3000)),
+        "env_step_legacy": lambda: bench_env_step(n(3000), lidar="legacy"),
+        "env_step_stats": lambda: bench_env_step(n(3000), stats=True),
+        "env_step_repeat4": lambda: bench_env_step(n(1000), action_repeat=4),
+        "get_obs": lambda: bench_get_obs(n(3000)),
+        "get_obs_legacy": lambda: bench_get_obs(n(3000), lidar="legacy"),
+        "reset": lambda: bench_reset(n(3000)),
+        "get_state": lambda: bench_state(n(3000)),
+        "set_state": lambda: bench_state(n(3000), restore=True),
+        "render_rgb_array": lambda: bench_render(n(300)),
+        "smooth_track_points": lambda: bench_smooth(n(1000)),
+        "track_compile": lambda: bench_track_compile(n(20)),
+        "track_load_cached": lambda: bench_track_load(n(200)),
+        "vec_step": lambda: bench_vec_step(n(100)),
+        "vec_step_repeat4": lambda: bench_vec_step(n(50), action_repeat=4),
+        "traffic_step": lambda: bench_traffic_step(n(50)),
+    }
+    for workers in ppo_workers:
+        benchmarks[f"ppo_workers_{workers}"] = lambda w=workers: bench_ppo(w, int(PPO_STEPS * max(scale, 0.5)))
+    benchmarks["ppo_vec64"] = lambda: bench_ppo("vec", int(PPO_STEPS * 4 * max(scale, 0.5)))
+
+    results = {}
+    for name, bench in benchmarks.items():
+        if only and not any(part in name for part in only):
+            continue
+        print(f"  {name}...", end=" ", flush=True)
+        results[name] = bench()
+        print(f"{results[name]['ops_per_sec']:.1f} оп/с")
+    return results
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Сравнение с эталоном: список (имя, было, стало, отношение, регрессия)."""
+    rows = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["ops_per_sec"]
+        after = result["ops_per_sec"]
+        ratio = after / before
+        rows.append((name, before, after, ratio, ratio < 1.0 - tolerance))
+    return rows
+
+
+def gate_skip_reason(report, baseline):
+    """Почему результаты нельзя проверять по эталону (None - можно).
+
+    На другой машине или с другими python/numpy скорость другая и без регрессий, а
+    --quick слишком шумный для порога в 25%: такие сравнения только печатаются.
+    """
+    if report.get("quick") or baseline.get("quick"):
+        return "замер --quick слишком шумный"
+    machine, before = report["machine"], baseline["machine"]
+    diff = [f"{key}: {before.get(key)} -> {machine.get(key)}" for key in MACHINE_KEYS
+            if machine.get(key) != before.get(key)]
+    if diff:
+        return "другая машина (" + ", ".join(diff) + ")"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры скорости CyberRace")
+    parser.add_argument("--out", default="benchmark_results.json", help="Куда записать результаты (JSON)")
+    parser.add_argument("--quick", action="store_true", help="Меньше повторов (быстрее, но шумнее)")
+    parser.add_argument("--only", nargs="*", help="Запустить только замеры, в имени которых есть эти строки")
+    parser.add_argument("--ppo-workers", type=int, nargs="*", default=PPO_WORKERS,
+                        help="Для скольких процессов мерить обучение PPO")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Эталон для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результаты как новый эталон")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Допустимое падение скорости (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    print("--- ЗАМЕРЫ ---")
+    results = run_benchmarks(args.quick, args.only, args.ppo_workers)
+    report = {"machine": machine_info(), "quick": args.quick, "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Результаты: {args.out}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Эталон обновлен: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        # Без эталона проверка регрессий ничего не проверяет - это ошибка, а не тихий успех
+        sys.exit(f"Эталона {args.baseline} нет - сравнивать не с чем (--save-baseline, чтобы создать)")
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline["results"], args.tolerance)
+    skip = gate_skip_reason(report, baseline)
+    print(f"\nСравнение с эталоном ({baseline['machine'].get('commit', '?')}):")
+    for name, before, after, ratio, regressed in rows:
+        mark = "  РЕГРЕССИЯ" if regressed and skip is None else ""
+        print(f"  {name:22s} {before:12.1f} -> {after:12.1f} оп/с  x{ratio:.2f}{mark}")
+    if skip is not None:
+        print(f"Проверка регрессий пропущена: {skip}")
+    elif any(row[4] for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
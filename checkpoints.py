@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+
+# Настройки
+MANIFEST_NAME = "checkpoints.json"  # Список чекпоинтов в папке хранилища
+KEEP_LAST = 5                       # Сколько последних чекпоинтов хранить
+KEEP_BEST = 3                       # Сколько лучших по оценке хранить
+KEEP_EVERY = 50                     # Каждый K-й чекпоинт хранится всегда (0 = не хранить)
+
+
+def _snapshot(value):
+    # Копия тензоров на CPU (вложенные dict/list - как в state_dict оптимизатора)
+    import torch
+
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: _snapshot(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_snapshot(item) for item in value)
+    return value
+
+
+def _weights_hash(params):
+    # Хэш весов политики: одинаковые веса (на любом шаге) - один файл
+    digest = hashlib.sha256()
+    for name, tensor in params["policy"].items():
+        digest.update(name.encode())
+        digest.update(tensor.numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+class CheckpointStore:
+    """Хранилище чекпоинтов PPO: запись в фоновом потоке, ограниченный размер на диске.
+
+    save() только снимает копию весов и состояния модели (миллисекунды) и
+    сразу возвращается; zip пишет фоновый поток - во временный файл и затем
+    os.replace, так что оборванная запись не оставляет битый чекпоинт.
+    Файлы совместимы с PPO.load.
+
+    Что хранится: последние keep_last, лучшие keep_best по оценке (score) и
+    каждый keep_every-й чекпоинт. Остальные удаляются после записи нового.
+    Оценку задает тот, кто сохраняет (play_race.py - средняя награда последних
+    эпизодов обучения); evaluate.py хранилище не трогает, его таблица лидеров
+    отдельная. Одинаковые веса (например, сохранение без обучения между ними)
+    не пишутся второй раз - запись ссылается на уже сохраненный файл.
+    Чекпоинт с явным именем (name) записывается всегда.
+    Список чекпоинтов - checkpoints.json в той же папке.
+    """
+
+    def __init__(self, directory, keep_last=KEEP_LAST, keep_best=KEEP_BEST, keep_every=KEEP_EVERY):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.keep_every = keep_every
+        os.makedirs(directory, exist_ok=True)
+        self._manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self._lock = threading.Lock()  # Список записей меняет фоновый поток, читает обучение
+        self.entries = self._load_manifest()
+        self._index = self.entries[-1]["index"] if self.entries else 0
+        # Недописанные файлы от прерванного запуска
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(directory, name))
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _load_manifest(self):
+        if not os.path.exists(self._manifest_path):
+            return []
+        with open(self._manifest_path) as f:
+            entries = json.load(f)["entries"]
+        # Файлы, удаленные руками, пропускаем
+        return [e for e in entries if os.path.exists(os.path.join(self.directory, e["file"]))]
+
+    def save(self, model, score=None, name=None):
+        """Ставит чекпоинт в очередь на запись и сразу возвращает его номер.
+
+        score - оценка для отбора лучших (больше - лучше), name - имя файла без
+        .zip (по умолчанию число шагов модели).
+        """
+        from stable_baselines3.common.save_util import data_to_json
+
+        data, params, pytorch_variables = _model_state(model)
+        self._index += 1
+        entry = {"index": self._index, "step": int(model.num_timesteps),
+                 "file": f"{name or model.num_timesteps}.zip", "score": score, "time": time.time()}
+        # data сериализуем здесь: буферы эпизодов меняются, как только обучение продолжится
+        self._queue.put((entry, name is not None, data_to_json(data), _snapshot(params),
+                         _snapshot(pytorch_variables)))
+        return self._index
+
+    def set_score(self, index, score):
+        """Оценка для уже сохраненного (или стоящего в очереди) чекпоинта - из того же процесса, что save."""
+        self._queue.put((index, score))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if len(item) == 2:
+                    self._apply_score(*item)
+                else:
+                    self._write(*item)
+            except Exception as error:
+                # Ошибка диска не должна останавливать многодневное обучение
+                print(f">>> Не удалось сохранить чекпоинт: {error!r}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, entry, named, serialized_data, params, pytorch_variables):
+        entry["hash"] = _weights_hash(params)
+        # Файл с явным именем пишем всегда: на него ссылаются по имени, а не через список
+        same = None if named else next((e for e in self.entries if e["hash"] == entry["hash"]), None)
+        if same is not None:
+            entry["file"] = same["file"]
+        else:
+            _write_zip(os.path.join(self.directory, entry["file"]), serialized_data, params, pytorch_variables)
+        with self._lock:
+            if same is None:
+                # Повторное имя (например, final_model) заменяет старые записи этого файла
+                self.entries = [e for e in self.entries if e["file"] != entry["file"]]
+            self.entries.append(entry)
+            self._prune()
+
+    def _apply_score(self, index, score):
+        with self._lock:
+            for entry in self.entries:
+                if entry["index"] == index:
+                    entry["score"] = score
+            self._prune()
+
+    def _prune(self):
+        keep = self.entries[-self.keep_last:] if self.keep_last > 0 else []
+        if self.keep_every > 0:
+            keep += [e for e in self.entries if e["index"] % self.keep_every == 0]
+        scored = [e for e in self.entries if e["score"] is not None]
+        keep += sorted(scored, key=lambda e: -e["score"])[:self.keep_best]
+        kept = {id(e) for e in keep}
+        removed = [e for e in self.entries if id(e) not in kept]
+        self.entries = [e for e in self.entries if id(e) in kept]
+        # Сначала список, потом файлы: список никогда не ссылается на удаленный файл
+        self._save_manifest()
+        used = {e["file"] for e in self.entries}
+        for name in {e["file"] for e in removed} - used:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _save_manifest(self):
+        tmp = f"{self._manifest_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"entries": self.entries}, f, indent=2)
+        os.replace(tmp, self._manifest_path)
+
+    def latest(self):
+        """Запись последнего сохраненного чекпоинта (None, если хранилище пустое)."""
+        with self._lock:
+            return max(self.entries, key=lambda e: e["index"], default=None)
+
+    def best(self):
+        """Запись чекпоинта с лучшей оценкой (None, если оценок нет)."""
+        with self._lock:
+            scored = [e for e in self.entries if e["score"] is not None]
+            return max(scored, key=lambda e: e["score"], default=None)
+
+    def path(self, entry):
+        return os.path.join(self.directory, entry["file"])
+
+    def wait(self):
+        """Ждет, пока все чекпоинты из очереди будут записаны."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _model_state(model):
+    # То же, что BaseAlgorithm.save отбирает для zip: атрибуты без torch-объектов и state_dict'ы
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for name in state_dicts_names + torch_variable_names:
+        exclude.add(name.split(".")[0])
+    for name in exclude:
+        data.pop(name, None)
+
+    pytorch_variables = None
+    if torch_variable_names:
+        from stable_baselines3.common.utils import recursive_getattr
+        pytorch_variables = {name: recursive_getattr(model, name) for name in torch_variable_names}
+    return data, model.get_parameters(), pytorch_variables
+
+
+def _write_zip(path, serialized_data, params, pytorch_variables):
+    # Формат save_to_zip_file из stable_baselines3, но данные уже сериализованы
+    import stable_baselines3 as sb3
+    import torch
+    from stable_baselines3.common.utils import get_system_info
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as file:
+        with zipfile.ZipFile(file, mode="w") as archive:
+            archive.writestr("data", serialized_data)
+            if pytorch_variables is not None:
+                with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as f:
+                    torch.save(pytorch_variables, f)
+            for name, state_dict in params.items():
+                with archive.open(f"{name}.pth", mode="w", force_zip64=True) as f:
+                    torch.save(state_dict, f)
+            archive.writestr("_stable_baselines3_version", sb3.__version__)
+            archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
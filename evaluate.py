@@ -0,0 +1,199 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+
+import numpy as np
+
+from policy_runtime import load_policy, read_race_config
+from race_env import CyberRacingEnv
+from race_core import END_CAUSES
+from track_library import DEFAULT_TRACK, TrackLibrary, generate_track
+
+# Настройки
+MODELS_GLOB = "models/**/*.zip"        # Какие чекпоинты оценивать по умолчанию
+EVAL_CACHE_PATH = "eval_cache.json"    # Результаты по хэшу содержимого чекпоинта
+LEADERBOARD_PATH = "leaderboard.json"  # Таблица лидеров
+EVAL_EPISODES = 16                     # Заездов на каждую трассу
+EVAL_TRACKS = 0                        # Случайных трасс в дополнение к основной
+EVAL_SEED = 0                          # Seed выбора действий (и первой случайной трассы)
+EVAL_VERSION = 1                       # Увеличить при изменении правил среды или метрик
+
+
+def file_hash(path):
+    """Хэш содержимого файла: переименованный или скопированный чекпоинт заново не оценивается."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def eval_key(content_hash, settings):
+    # Один и тот же чекпоинт с другими настройками оценки - другая запись в кэше
+    data = json.dumps({"version": EVAL_VERSION, "checkpoint": content_hash, **settings}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def checkpoint_settings(path, settings):
+    """Настройки оценки одного чекпоинта: общие плюс лидар (если не задан явно) и параметры гонки,
+    с которыми он обучен. Все они входят в ключ кэша."""
+    config = read_race_config(path)
+    result = {**settings, "lidar": settings["lidar"] or config["lidar"]}
+    if config["params"]:
+        result["params"] = config["params"]
+    return result
+
+
+def eval_specs(num_tracks, first_seed):
+    """Трассы оценки: основная и num_tracks случайных."""
+    return [DEFAULT_TRACK] + [generate_track(seed) for seed in range(first_seed, first_seed + num_tracks)]
+
+
+def run_episodes(model, envs, track, deterministic):
+    """Один заезд в каждой среде на трассе track. Действия для всех машин - одним вызовом политики."""
+    obs = np.stack([env.reset(options={"track": track})[0] for env in envs])
+    rewards = np.zeros(len(envs))
+    results = [None] * len(envs)
+    active = list(range(len(envs)))
+    while active:
+        actions, _ = model.predict(obs[active], deterministic=deterministic)
+        still = []
+        for action, i in zip(actions, active):
+            env = envs[i]
+            obs[i], reward, terminated, truncated, _ = env.step(action)
+            rewards[i] += reward
+            if terminated or truncated:
+                results[i] = {"reward": float(rewards[i]), "cause": env.end_cause, "ticks": int(env.steps)}
+            else:
+                still.append(i)
+        active = still
+    return results
+
+
+def evaluate_checkpoint(path, specs, settings, record_dir=None):
+    """Оценка одного чекпоинта (выполняется в процессе пула).
+
+    С record_dir каждая машина пишет свои заезды в лог траектории record_dir/car<N>.traj.
+    """
+    if not path.endswith(".npz"):
+        import torch
+        torch.set_num_threads(1)  # Параллельность - процессами пула, а не потоками torch
+    # Экспорт .npz (policy_runtime.py) считается на NumPy: воркер не грузит torch
+    model = load_policy(path, seed=settings["seed"])
+
+    library = TrackLibrary(specs)
+    envs = [CyberRacingEnv(lidar=settings["lidar"], action_repeat=settings["action_repeat"],
+                           params=settings.get("params"),
+                           record=os.path.join(record_dir, f"car{i}.traj") if record_dir else None)
+            for i in range(settings["episodes"])]
+    episodes = []
+    for index in range(len(library)):
+        for result in run_episodes(model, envs, library[index], settings["deterministic"]):
+            episodes.append({"track": index, **result})
+    for env in envs:
+        env.close()
+    return summarize(episodes)
+
+
+def summarize(episodes):
+    rewards = np.array([e["reward"] for e in episodes])
+    lap_ticks = [e["ticks"] for e in episodes if e["cause"] == "lap"]
+    ends = dict.fromkeys(END_CAUSES, 0)
+    for e in episodes:
+        ends[e["cause"]] += 1
+    return {
+        "episodes": len(episodes),
+        "lap_rate": len(lap_ticks) / len(episodes),
+        "mean_reward": float(rewards.mean()),
+        "std_reward": float(rewards.std()),
+        "mean_lap_ticks": float(np.mean(lap_ticks)) if lap_ticks else None,  # Время круга в тиках физики
+        "best_lap_ticks": min(lap_ticks) if lap_ticks else None,
+        "ends": ends,
+    }
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(data, path):
+    # Через временный файл: прерванная запись не портит кэш
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def leaderboard(rows):
+    """Сначала доля кругов, затем средняя награда, затем время круга."""
+    return sorted(rows, key=lambda r: (-r["lap_rate"], -r["mean_reward"],
+                                       r["mean_lap_ticks"] if r["mean_lap_ticks"] is not None else float("inf")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оценка чекпоинтов CyberRace и таблица лидеров")
+    parser.add_argument("paths", nargs="*", help=f"Чекпоинты (.zip) или их экспорт в NumPy (.npz), по умолчанию {MODELS_GLOB}")
+    parser.add_argument("--episodes", type=int, default=EVAL_EPISODES, help="Заездов на трассу")
+    parser.add_argument("--tracks", type=int, default=EVAL_TRACKS, help="Случайных трасс помимо основной")
+    parser.add_argument("--seed", type=int, default=EVAL_SEED, help="Seed действий и случайных трасс")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Без случайности в действиях (тогда хватит одного заезда на трассу)")
+    parser.add_argument("--lidar", default=None, choices=["field", "legacy"],
+                        help="Режим лидара (по умолчанию тот, на котором обучен чекпоинт)")
+    parser.add_argument("--action-repeat", type=int, default=1, help="Повтор действия, как при обучении")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Процессов для оценки")
+    parser.add_argument("--cache", default=EVAL_CACHE_PATH, help="Файл кэша результатов")
+    parser.add_argument("--out", default=LEADERBOARD_PATH, help="Куда записать таблицу лидеров")
+    parser.add_argument("--record", metavar="DIR",
+                        help="Записать траектории оцениваемых чекпоинтов в DIR/<ключ>/ (для replay.py)")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(MODELS_GLOB, recursive=True))
+    if not paths:
+        print("Чекпоинты не найдены")
+        return
+    settings = {"episodes": args.episodes, "tracks": args.tracks, "seed": args.seed,
+                "deterministic": args.deterministic, "lidar": args.lidar, "action_repeat": args.action_repeat}
+
+    cache = load_cache(args.cache)
+    path_settings = {path: checkpoint_settings(path, settings) for path in paths}
+    keys = {path: eval_key(file_hash(path), path_settings[path]) for path in paths}
+    todo = sorted({keys[p]: p for p in paths if keys[p] not in cache}.values())
+    print(f"Чекпоинтов: {len(paths)}, новых для оценки: {len(todo)}")
+
+    if todo:
+        specs = eval_specs(args.tracks, args.seed)
+        TrackLibrary(specs).compile_all()  # Воркеры только открывают готовые трассы
+        # Как и воркеры обучения: на Linux fork, библиотеки остаются общими страницами
+        ctx = mp.get_context("fork" if sys.platform.startswith("linux") else None)
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(todo)), mp_context=ctx) as pool:
+            futures = {pool.submit(evaluate_checkpoint, path, specs, path_settings[path],
+                                   os.path.join(args.record, keys[path]) if args.record else None): path for path in todo}
+            for future in as_completed(futures):
+                path = futures[future]
+                cache[keys[path]] = future.result()
+                save_json(cache, args.cache)  # Сохраняем сразу: прерванная оценка не теряется
+                print(f"  {path}: круги {cache[keys[path]]['lap_rate']:.0%}, "
+                      f"награда {cache[keys[path]]['mean_reward']:.1f}")
+
+    rows = leaderboard([{"path": path, "key": keys[path], **cache[keys[path]]} for path in paths])
+    save_json({"settings": settings, "leaderboard": rows}, args.out)
+
+    print(f"\n{'#':>3} {'чекпоинт':40s} {'круги':>6} {'награда':>9} {'круг, тиков':>12}  стена/назад/тайм-аут")
+    for place, row in enumerate(rows, 1):
+        lap = f"{row['mean_lap_ticks']:.0f}" if row["mean_lap_ticks"] is not None else "-"
+        ends = row["ends"]
+        print(f"{place:>3} {row['path']:40s} {row['lap_rate']:>6.0%} {row['mean_reward']:>9.1f} {lap:>12}  "
+              f"{ends['wall']}/{ends['wrong_way']}/{ends['timeout']}")
+    print(f"Таблица лидеров: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from policy_runtime import load_policy, read_race_config
+from race_core import RaceSim
+from track_library import generate_track, load_track
+
+# Настройки
+CAR_COLORS = [(255, 50, 50), (50, 160, 255), (255, 220, 50), (60, 255, 120),
+              (255, 80, 255), (255, 150, 40), (150, 110, 255), (40, 255, 255)]
+FINISHED_COLOR = (90, 90, 100)  # Машина, у которой заезд закончился
+RACE_FPS = 60
+
+
+class GhostRace:
+    """Гонка призраков: K машин (разные чекпоинты или разные seed) на одной трассе одновременно.
+
+    Машины друг другу не мешают. Физика всех машин - один RaceSim, а действия
+    каждой модели считаются одним вызовом predict на всю ее пачку машин за кадр.
+    Машина, закончившая заезд, замирает там, где закончила.
+
+    traffic=True - машины мешают друг другу (traffic.TrafficSim) и стартуют
+    решеткой, закончившая заезд машина убирается с трассы. Модели, обученные
+    без машин (9 значений наблюдения), получают только свою часть наблюдения.
+
+    params - параметры гонки (race_core.RACE_PARAMS), общие для всех машин.
+    """
+
+    def __init__(self, models, labels, track, cars_per_model=1, deterministic=False,
+                 lidar="field", action_repeat=1, traffic=False, params=None):
+        self.models = models
+        self.deterministic = deterministic
+        self.traffic = traffic
+        num_cars = len(models) * cars_per_model
+        if traffic:
+            from traffic import TrafficSim  # traffic.py тянет за собой VecEnv из SB3
+            self.sim = TrafficSim(track, num_cars=num_cars, lidar=lidar, action_repeat=action_repeat,
+                                  params=params)
+        else:
+            self.sim = RaceSim(track, num_cars=num_cars, lidar=lidar, action_repeat=action_repeat, params=params)
+        self.obs_sizes = [_obs_size(model) for model in models]
+        # Машины каждой модели - подряд идущие номера
+        owner = np.repeat(np.arange(len(models)), cars_per_model)
+        self.groups = [np.flatnonzero(owner == m) for m in range(len(models))]
+        self.labels = [labels[m] if cars_per_model == 1 else f"{labels[m]} #{i % cars_per_model + 1}"
+                       for i, m in enumerate(owner)]
+        self.colors = [CAR_COLORS[i % len(CAR_COLORS)] for i in range(num_cars)]
+        self.reset()
+
+    def reset(self):
+        self.sim.reset()
+        if self.traffic:
+            self.sim.active[:] = True
+        n = self.sim.num_cars
+        self.done = np.zeros(n, dtype=bool)
+        self.total_reward = np.zeros(n)
+        self.finish_ticks = np.zeros(n, dtype=np.int64)
+        # Где машина закончила заезд (после езды назад в sim.car_pos уже старт, поэтому из sim.end_pos)
+        self.final_pos = self.sim.car_pos.copy()
+        self.final_angle = self.sim.car_angle.copy()
+
+    def step(self):
+        """Один кадр для всех машин. Возвращает True, когда все заезды закончились."""
+        obs = self.sim.observe()
+        actions = np.zeros((self.sim.num_cars, 2))
+        for model, cars, size in zip(self.models, self.groups, self.obs_sizes):
+            actions[cars], _ = model.predict(obs[cars, :size], deterministic=self.deterministic)
+        rewards, terminated = self.sim.step(actions)
+
+        live = ~self.done
+        self.total_reward[live] += rewards[live]
+        finished = terminated & live
+        self.done |= finished
+        self.finish_ticks[finished] = self.sim.steps[finished]
+        if self.traffic:
+            self.sim.active[finished] = False
+        driving = live & ~finished
+        self.final_pos[driving] = self.sim.car_pos[driving]
+        self.final_angle[driving] = self.sim.car_angle[driving]
+        self.final_pos[finished] = self.sim.end_pos[finished]
+        self.final_angle[finished] = self.sim.end_angle[finished]
+        return self.done.all()
+
+    def draw(self, renderer):
+        # Закончившие - серые и под остальными
+        order = sorted(range(self.sim.num_cars), key=lambda i: not self.done[i])
+        cars = [(self.final_pos[i, 0], self.final_pos[i, 1], self.final_angle[i],
+                 FINISHED_COLOR if self.done[i] else self.colors[i]) for i in order]
+        hud = [(f"{self.labels[i]}: {self.total_reward[i]:.0f}  CP {self.sim.current_checkpoint[i]}"
+                f"  LAPS {self.sim.laps[i]}{'  (финиш)' if self.done[i] else ''}", self.colors[i])
+               for i in range(self.sim.num_cars)]
+        return renderer.draw_cars(cars, hud)
+
+    def results(self):
+        """Итоги заезда, лучшие сверху: (подпись, награда, круги, тиков до конца заезда)."""
+        rows = [(self.labels[i], self.total_reward[i], int(self.sim.laps[i]), int(self.finish_ticks[i]))
+                for i in range(self.sim.num_cars)]
+        return sorted(rows, key=lambda r: -r[1])
+
+
+def _obs_size(model):
+    # Длина наблюдения модели: у SB3 - observation_space, у policy_runtime.NumpyPolicy - obs_shape
+    shape = model.obs_shape if hasattr(model, "obs_shape") else model.observation_space.shape
+    return shape[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Гонка призраков: несколько моделей на одной трассе")
+    parser.add_argument("checkpoints", nargs="+", help="Модели PPO (.zip) или их экспорт в NumPy (.npz)")
+    parser.add_argument("--cars", type=int, default=1, help="Машин на каждую модель (разные случайные действия)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed случайных действий")
+    parser.add_argument("--deterministic", action="store_true", help="Без случайности в действиях")
+    parser.add_argument("--track-seed", type=int, default=None, help="Случайная трасса с этим seed (по умолчанию основная)")
+    parser.add_argument("--lidar", default=None, choices=["field", "legacy"],
+                        help="Режим лидара (по умолчанию тот, на котором обучены модели)")
+    parser.add_argument("--action-repeat", type=int, default=1, help="Повтор действия, как при обучении")
+    parser.add_argument("--traffic", action="store_true",
+                        help="Машины мешают друг другу и видят друг друга лидаром (traffic.py)")
+    parser.add_argument("--races", type=int, default=0, help="Сколько заездов (0 = пока не закрыто окно)")
+    parser.add_argument("--headless", action="store_true", help="Без окна: только итоги заездов")
+    args = parser.parse_args()
+
+    # Физика и лидар одни на всех: модели должны быть обучены с одними параметрами гонки
+    # (лидар можно задать явно --lidar)
+    configs = {json.dumps({**read_race_config(path), **({"lidar": args.lidar} if args.lidar else {})}, sort_keys=True)
+               for path in args.checkpoints}
+    if len(configs) > 1:
+        raise SystemExit(f"Модели обучены с разными настройками гонки: {sorted(configs)}")
+    config = json.loads(configs.pop())
+
+    models = [load_policy(path, seed=args.seed) for path in args.checkpoints]
+    labels = [os.path.splitext(os.path.basename(path))[0] for path in args.checkpoints]
+    track = load_track() if args.track_seed is None else load_track(generate_track(args.track_seed))
+    race = GhostRace(models, labels, track, args.cars, args.deterministic, config["lidar"], args.action_repeat,
+                     args.traffic, config["params"])
+
+    renderer = None
+    if not args.headless:
+        import pygame
+        from race_render import RaceRenderer
+        renderer = RaceRenderer(track, RACE_FPS)
+        pygame.display.set_caption(f"CyberRace AI - Ghost Race ({race.sim.num_cars} машин)")
+
+    race_number = 0
+    try:
+        while args.races == 0 or race_number < args.races:
+            race_number += 1
+            race.reset()
+            finished = False
+            while not finished:
+                finished = race.step()
+                if renderer is not None:
+                    race.draw(renderer)
+                    for event in pygame.event.get():
+                        if event.type == pygame.QUIT:
+                            raise KeyboardInterrupt
+
+            print(f"\nЗаезд {race_number}:")
+            for place, (label, reward, laps, ticks) in enumerate(race.results(), 1):
+                print(f"  {place}. {label:30s} награда {reward:8.1f}  круги {laps}  тиков {ticks}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if renderer is not None:
+            renderer.close()
+
+if __name__ == "__main__":
+    main()
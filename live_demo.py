@@ -0,0 +1,106 @@
+import multiprocessing as mp
+import queue
+import signal
+
+
+class LiveDemo:
+    """Демонстрация в отдельном процессе: окно pygame работает рядом с обучением, а не вместо него.
+
+    После каждой генерации обучение отдает веса политики через очередь на одно
+    место и сразу продолжает: если зритель еще не забрал прошлые веса, они
+    заменяются новыми. Зритель сам решает, когда их взять - в начале каждого
+    заезда. Закрытие окна завершает только процесс зрителя.
+    """
+
+    def __init__(self, policy_class, policy_kwargs=None, env_kwargs=None):
+        # spawn, а не fork: в процессе обучения уже работают потоки torch
+        ctx = mp.get_context("spawn")
+        self.queue = ctx.Queue(maxsize=1)
+        # Данные, которые никто не прочитал, не должны держать обучение при выходе
+        self.queue.cancel_join_thread()
+        self.process = ctx.Process(target=_run_viewer, daemon=True,
+                                   args=(self.queue, policy_class, policy_kwargs or {}, env_kwargs or {}))
+        self.process.start()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def send(self, policy, generation):
+        """Отдает веса зрителю, никогда не ждет. Возвращает False, если окно уже закрыто."""
+        if not self.process.is_alive():
+            return False
+        # Копия весов: очередь пишет данные в фоне, а обучение тем временем меняет параметры
+        weights = {name: value.detach().cpu().numpy().copy() for name, value in policy.state_dict().items()}
+        message = (generation, weights)
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # Зритель еще смотрит старую генерацию - заменяем ее веса свежими
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(message)
+            except queue.Full:
+                pass
+        return True
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=5)
+
+
+def _latest(weights_queue):
+    # Самые свежие веса из очереди (None, если новых нет)
+    message = None
+    while True:
+        try:
+            message = weights_queue.get_nowait()
+        except queue.Empty:
+            return message
+
+
+def _run_viewer(weights_queue, policy_class, policy_kwargs, env_kwargs):
+    # Ctrl+C обрабатывает процесс обучения: он сохраняет модель и сам закрывает зрителя
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import pygame
+    import torch
+
+    from race_env import CyberRacingEnv
+
+    env = CyberRacingEnv(render_mode="human", **env_kwargs)
+    policy = policy_class(env.observation_space, env.action_space, lambda _: 0.0, **policy_kwargs)
+    policy.set_training_mode(False)
+
+    # Первые веса ждем (окна еще нет, ждать не страшно)
+    generation, weights = weights_queue.get()
+    try:
+        while True:
+            message = _latest(weights_queue)
+            if message is not None:
+                generation, weights = message
+            policy.load_state_dict({name: torch.as_tensor(value) for name, value in weights.items()})
+
+            obs, _ = env.reset()
+            done = False
+            total_reward = 0
+            pygame.display.set_caption(f"CyberRace AI - Gen {generation}")
+
+            while not done:
+                # Спрашиваем у политики действие
+                action, _ = policy.predict(obs)
+                obs, reward, terminated, truncated, info = env.step(action)
+                done = terminated or truncated
+                total_reward += reward
+
+                # Крестик окна закрывает только зрителя, обучение продолжается
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        return
+
+            print(f"   Заезд (генерация {generation}): Награда = {total_reward:.1f}")
+    finally:
+        env.close()
@@ -1,77 +1,147 @@
-import pygame
 from stable_baselines3 import PPO
+from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from checkpoints import CheckpointStore
+from live_demo import LiveDemo
+from policy_runtime import read_race_config
 from race_env import CyberRacingEnv
+from race_stats import RaceStatsCallback
+from track import TrackField
+from track_library import TrackLibrary, load_track
+import argparse
 import os
+import signal
+import sys
 
 # Настройки
 MODELS_DIR = "models/CyberLive"
 LOG_DIR = "logs_cyber_live"
-SHOW_EVERY_STEPS = 10000  # Каждые 5000 шагов показываем результат
-EPISODES_TO_SHOW = 2     # Сколько заездов показывать за раз
+SHOW_EVERY_STEPS = 10000  # Каждые 10000 шагов сохраняем модель и отдаем веса в окно демонстрации
+KEEP_LAST = 5            # Чекпоинтов на диске: последние, лучшие по средней награде обучения и каждый K-й
+KEEP_BEST = 3
+KEEP_EVERY = 50
+SHOW_DEMO = True         # Окно демонстрации (отдельный процесс, обучение его не ждет)
+NUM_WORKERS = 1          # Сколько процессов-симуляторов для обучения (1 = все в этом процессе)
+NUM_TRACKS = 0           # Сколько случайных трасс для обучения (0 = только основная трасса)
+COLLECT_STATS = False    # Время по фазам шага и причины завершения в TensorBoard
 
 os.makedirs(MODELS_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
+def make_train_env(track_handle, tracks=None, stats=False, lidar="field", params=None):
+    """Фабрика среды для процесса-воркера: трасса берется из общей памяти, а не рисуется заново."""
+    def _init():
+        # Ctrl+C обрабатывает главный процесс: он сохраняет модель и сам закрывает воркеры
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        return Monitor(CyberRacingEnv(render_mode=None, lidar=lidar, field=TrackField.attach(track_handle),
+                                      tracks=tracks, stats=stats, params=params))
+    return _init
+
 def main():
+    parser = argparse.ArgumentParser(description="Живое обучение CyberRace")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Сколько процессов-симуляторов использовать для обучения")
+    parser.add_argument("--tracks", type=int, default=NUM_TRACKS,
+                        help="Обучаться на стольких случайных трассах (0 = только основная)")
+    parser.add_argument("--stats", action="store_true", default=COLLECT_STATS,
+                        help="Писать в TensorBoard время фаз шага и причины завершения эпизодов")
+    parser.add_argument("--no-demo", action="store_true", default=not SHOW_DEMO,
+                        help="Обучать без окна демонстрации")
+    parser.add_argument("--resume", nargs="?", const="latest", metavar="PATH",
+                        help="Продолжить обучение: с последнего чекпоинта в хранилище или с указанного .zip")
+    args = parser.parse_args()
+
     print("--- ЗАПУСК ЖИВОГО ОБУЧЕНИЯ ---")
-    print(f"Тренировка {SHOW_EVERY_STEPS} шагов -> Демонстрация -> Повтор")
+    print(f"Тренировка без пауз, каждые {SHOW_EVERY_STEPS} шагов - новые веса в окно демонстрации")
 
-    # 1. Создаем ДВЕ среды
-    # env_train: Без графики, работает максимально быстро
-    env_train = CyberRacingEnv(render_mode=None)
-    
-    # env_show: С графикой, для твоих глаз
-    env_show = CyberRacingEnv(render_mode="human")
+    # Библиотека случайных трасс: компилируем в кэш один раз здесь,
+    # воркеры потом только открывают готовые файлы
+    tracks = None
+    if args.tracks > 0:
+        tracks = TrackLibrary.generated(args.tracks)
+        tracks.compile_all()
+        print(f"Трасс для обучения: {len(tracks)}")
 
-    # 2. Создаем или загружаем модель
-    # Если хочешь продолжить обучение, раскомментируй load
-    # model = PPO.load("models/CyberLive/650000", env=env_train)
-    model = PPO("MlpPolicy", env_train, verbose=0, tensorboard_log=LOG_DIR, device="auto")
+    # Чекпоинт для --resume: среда обучения должна быть такой же, как при его обучении
+    # (параметры гонки, например из sweep.py, записаны в самом чекпоинте)
+    store = CheckpointStore(MODELS_DIR, keep_last=KEEP_LAST, keep_best=KEEP_BEST, keep_every=KEEP_EVERY)
+    resume_path = args.resume
+    if resume_path == "latest":
+        latest = store.latest()
+        resume_path = store.path(latest) if latest is not None else None
+        if resume_path is None:
+            print("Чекпоинтов в хранилище нет, начинаем с нуля")
+    # Новая модель учится на точном лидаре, чекпоинты без race_config - на старом
+    race_config = read_race_config(resume_path) if resume_path is not None else {"lidar": "field", "params": {}}
+    lidar, params = race_config["lidar"], race_config["params"]
+    if resume_path is not None:
+        print(f"Лидар: {lidar}, параметры гонки: {params or 'по умолчанию'}")
 
-    generation = 0
-    
+    # 1. Среда для обучения: без графики, работает максимально быстро.
+    # Среда с графикой живет в процессе демонстрации (live_demo.py)
+    track_shm = None
     try:
-        while True:
-            generation += 1
-            print(f"\n>>> ГЕНЕРАЦИЯ {generation}: Идет жесткое обучение ({SHOW_EVERY_STEPS} шагов)...")
-            
-            # --- ФАЗА 1: ТРЕНИРОВКА (Быстрая) ---
-            model.learn(total_timesteps=SHOW_EVERY_STEPS, reset_num_timesteps=False)
-            model.save(f"{MODELS_DIR}/{generation * SHOW_EVERY_STEPS}")
-            
-            # --- ФАЗА 2: ДЕМОНСТРАЦИЯ (Красивая) ---
-            print(f">>> ГЕНЕРАЦИЯ {generation}: Смотрим, чему научился...")
-            
-            for ep in range(EPISODES_TO_SHOW):
-                obs, _ = env_show.reset()
-                done = False
-                total_reward = 0
-                
-                # Пишем номер поколения в заголовок окна (небольшой хак)
-                pygame.display.set_caption(f"CyberRace AI - Gen {generation} - Replay {ep+1}")
+        if args.workers > 1:
+            # Маска и поле расстояний строятся один раз здесь и отдаются воркерам
+            # через общую память (только чтение), поэтому память на воркер не растет
+            track_shm, track_handle = load_track().field.share()
+            # На Linux воркеры форкаются: уже загруженные библиотеки (torch)
+            # остаются общими страницами, а не грузятся в каждом процессе заново
+            start_method = "fork" if sys.platform.startswith("linux") else None
+            env_train = SubprocVecEnv([make_train_env(track_handle, tracks, args.stats, lidar, params)
+                                       for _ in range(args.workers)],
+                                      start_method=start_method)
+            print(f"Обучение в {args.workers} процессах")
+        else:
+            env_train = CyberRacingEnv(render_mode=None, lidar=lidar, tracks=tracks, stats=args.stats, params=params)
+
+        # 2. Создаем или загружаем модель (--resume - с последнего чекпоинта хранилища)
+        if resume_path is not None:
+            model = PPO.load(resume_path, env=env_train, tensorboard_log=LOG_DIR, device="auto")
+            print(f"Продолжаем с {resume_path} ({model.num_timesteps} шагов)")
+        else:
+            model = PPO("MlpPolicy", env_train, verbose=0, tensorboard_log=LOG_DIR, device="auto")
+        model.race_config = race_config  # Сохраняется в каждый чекпоинт
+
+        # 3. Окно демонстрации: отдельный процесс, веса получает после каждой генерации
+        demo = None
+        if not args.no_demo:
+            demo = LiveDemo(model.policy_class, model.policy_kwargs,
+                            env_kwargs={"tracks": tracks, "lidar": lidar, "params": params})
 
-                while not done:
-                    # Спрашиваем у модели действие
-                    action, _ = model.predict(obs)
-                    
-                    # Делаем шаг в красивой среде
-                    obs, reward, terminated, truncated, info = env_show.step(action)
-                    done = terminated or truncated  # Эпизод завершен если terminated или truncated
-                    total_reward += reward
-                    
-                    # Обработка выхода через крестик окна во время просмотра
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            raise KeyboardInterrupt
+        # Статистика среды публикуется в конце каждого rollout рядом с метриками PPO
+        callback = RaceStatsCallback() if args.stats else None
 
-                print(f"   Заезд {ep+1}: Награда = {total_reward:.1f}")
+        generation = 0
+    
+        try:
+            while True:
+                generation += 1
+                print(f"\n>>> ГЕНЕРАЦИЯ {generation}: Идет жесткое обучение ({SHOW_EVERY_STEPS} шагов)...")
+            
+                # Обучение не останавливается на показ: веса уходят зрителю без ожидания
+                model.learn(total_timesteps=SHOW_EVERY_STEPS, reset_num_timesteps=False, callback=callback)
+                # Запись на диск - в фоне; оценка для отбора лучших - средняя награда последних эпизодов
+                rewards = [info["r"] for info in model.ep_info_buffer]
+                store.save(model, score=sum(rewards) / len(rewards) if rewards else None)
+                if demo is not None and not demo.send(model.policy, generation):
+                    print(">>> Окно демонстрации закрыто, обучение продолжается")
+                    demo = None
 
-    except KeyboardInterrupt:
-        print("\nОстановка обучения. Сохраняю модель...")
-        model.save(f"{MODELS_DIR}/final_model")
-        env_train.close()
-        env_show.close()
-        print("Готово.")
+        except KeyboardInterrupt:
+            print("\nОстановка обучения. Сохраняю модель...")
+            store.save(model, name="final_model")
+            store.close()  # Дожидаемся записи всех чекпоинтов из очереди
+            env_train.close()
+            if demo is not None:
+                demo.close()
+            print("Готово.")
+    finally:
+        # Общая память трассы освобождается при любом выходе, в том числе по ошибке,
+        # иначе сегмент остается в /dev/shm
+        if track_shm is not None:
+            track_shm.close()
+            track_shm.unlink()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
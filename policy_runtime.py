@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import zipfile
+
+import numpy as np
+
+# Настройки
+RUNTIME_VERSION = 1
+CHECK_STEPS = 2000    # Шагов среды для сверки экспорта с model.predict
+CHECK_TOLERANCE = 1e-5
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0),
+}
+# Настройки гонки чекпоинтов, сохраненных до race_config: они обучались на старом лидаре
+DEFAULT_RACE_CONFIG = {"lidar": "legacy", "params": {}}
+
+
+def export_policy(model, path):
+    """Веса актора PPO (MlpPolicy, Box -> Box) в .npz для NumpyPolicy. Нужен torch, но только здесь."""
+    from torch import nn
+    from stable_baselines3.common.distributions import DiagGaussianDistribution
+    from stable_baselines3.common.torch_layers import FlattenExtractor
+
+    policy = model.policy
+    if not isinstance(policy.pi_features_extractor, FlattenExtractor):
+        raise ValueError(f"Экспорт поддерживает только FlattenExtractor, а не {type(policy.pi_features_extractor).__name__}")
+    if not isinstance(policy.action_dist, DiagGaussianDistribution) or policy.squash_output:
+        raise ValueError("Экспорт поддерживает только непрерывные действия без squash_output")
+
+    def numpy(tensor):
+        return tensor.detach().cpu().numpy().copy()
+
+    arrays = {}
+    activations = []
+    for layer in policy.mlp_extractor.policy_net:
+        if isinstance(layer, nn.Linear):
+            i = len(activations)
+            arrays[f"weight{i}"] = numpy(layer.weight).T.copy()  # x @ weight без транспонирования при запуске
+            arrays[f"bias{i}"] = numpy(layer.bias)
+            activations.append("")
+        elif type(layer).__name__ in ACTIVATIONS and activations:
+            activations[-1] = type(layer).__name__
+        else:
+            raise ValueError(f"Неподдерживаемый слой: {layer}")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, version=RUNTIME_VERSION, activations=np.array(activations),
+             race_config=json.dumps(getattr(model, "race_config", None) or {}),
+             obs_shape=np.array(policy.observation_space.shape),
+             low=policy.action_space.low, high=policy.action_space.high,
+             action_weight=numpy(policy.action_net.weight).T.copy(), action_bias=numpy(policy.action_net.bias),
+             log_std=numpy(policy.log_std), **arrays)
+
+
+class NumpyPolicy:
+    """Политика из export_policy на одном NumPy: без torch и stable_baselines3.
+
+    predict повторяет model.predict из SB3: одно наблюдение или пачка,
+    deterministic=True - среднее гауссианы, иначе случайное действие
+    (те же распределения, но свой генератор: числа не совпадают с torch).
+    Действия обрезаются по границам action_space, как в SB3.
+    """
+
+    def __init__(self, path, seed=None):
+        with np.load(path) as data:
+            if int(data["version"]) != RUNTIME_VERSION:
+                raise ValueError(f"Неизвестная версия экспорта: {int(data['version'])}")
+            activations = [str(a) for a in data["activations"]]
+            self.layers = [(data[f"weight{i}"], data[f"bias{i}"], ACTIVATIONS.get(name))
+                           for i, name in enumerate(activations)]
+            self.action_weight = data["action_weight"]
+            self.action_bias = data["action_bias"]
+            self.std = np.exp(data["log_std"])
+            self.low = data["low"]
+            self.high = data["high"]
+            self.obs_shape = tuple(int(n) for n in data["obs_shape"])
+        self.rng = np.random.default_rng(seed)
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        obs = np.asarray(observation, dtype=np.float32)
+        single = obs.shape == self.obs_shape
+        if not single and obs.shape[1:] != self.obs_shape:
+            raise ValueError(f"Наблюдение формы {obs.shape}, а политика ждет {self.obs_shape}")
+        x = obs.reshape(-1, int(np.prod(self.obs_shape)))
+        for weight, bias, activation in self.layers:
+            x = x @ weight + bias
+            if activation is not None:
+                x = activation(x)
+        actions = x @ self.action_weight + self.action_bias
+        if not deterministic:
+            actions = actions + self.std * self.rng.standard_normal(actions.shape, dtype=np.float32)
+        actions = np.clip(actions, self.low, self.high)
+        return (actions[0] if single else actions), state
+
+
+def read_race_config(path):
+    """Настройки гонки, с которыми обучен чекпоинт (.zip или .npz): {"lidar": ..., "params": {...}}.
+
+    Модель при этом не загружается. У PPO это атрибут race_config, который
+    сохраняется в zip вместе с моделью; чего в чекпоинте нет - из DEFAULT_RACE_CONFIG.
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            stored = json.loads(str(data["race_config"])) if "race_config" in data else {}
+    else:
+        with zipfile.ZipFile(path) as archive:
+            stored = json.loads(archive.read("data")).get("race_config") or {}
+    return {**DEFAULT_RACE_CONFIG, **stored}
+
+
+def load_policy(path, seed=None):
+    """Модель для predict: экспорт .npz - без torch, иначе чекпоинт PPO целиком."""
+    if path.endswith(".npz"):
+        return NumpyPolicy(path, seed=seed)
+    import torch
+    from stable_baselines3 import PPO
+
+    if seed is not None:
+        torch.manual_seed(seed)
+    return PPO.load(path, device="cpu")
+
+
+def check_export(model, policy, steps):
+    """Наибольшее расхождение с model.predict(deterministic=True) на заездах и на случайных наблюдениях."""
+    from race_env import CyberRacingEnv
+
+    config = {**DEFAULT_RACE_CONFIG, **(getattr(model, "race_config", None) or {})}
+    env = CyberRacingEnv(lidar=config["lidar"], params=config["params"])
+    obs, _ = env.reset(seed=0)
+    seen = []
+    for _ in range(steps):
+        seen.append(obs)
+        action, _ = policy.predict(obs, deterministic=True)
+        obs, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            obs, _ = env.reset()
+    env.close()
+    space = model.observation_space
+    random = np.random.default_rng(0).uniform(space.low, space.high, (steps,) + space.shape).astype(np.float32)
+    batch = np.concatenate([np.stack(seen), random])
+
+    expected, _ = model.predict(batch, deterministic=True)
+    actual, _ = policy.predict(batch, deterministic=True)
+    single = max(np.abs(model.predict(o, deterministic=True)[0] - policy.predict(o, deterministic=True)[0]).max()
+                 for o in batch[:100])
+    return max(float(np.abs(expected - actual).max()), float(single))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт политики PPO в NumPy (.npz) для запуска без torch")
+    parser.add_argument("checkpoint", help="Модель PPO (.zip)")
+    parser.add_argument("--out", help="Куда записать экспорт (по умолчанию рядом, с расширением .npz)")
+    parser.add_argument("--check-steps", type=int, default=CHECK_STEPS,
+                        help="Шагов среды для сверки с model.predict (0 = без сверки)")
+    args = parser.parse_args()
+
+    from stable_baselines3 import PPO
+
+    model = PPO.load(args.checkpoint, device="cpu")
+    out = args.out or os.path.splitext(args.checkpoint)[0] + ".npz"
+    export_policy(model, out)
+    print(f"Экспорт: {out} ({os.path.getsize(out) / 1024:.0f} КБ)")
+
+    if args.check_steps > 0:
+        error = check_export(model, NumpyPolicy(out), args.check_steps)
+        print(f"Расхождение с model.predict(deterministic=True): {error:.2e}")
+        if error > CHECK_TOLERANCE:
+            raise SystemExit(f"Расхождение больше допустимого {CHECK_TOLERANCE}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import numpy as np
+
+from track import RAY_ANGLES, MAX_RAY_DIST, segments_cross
+
+MAX_SPEED = 15.0
+MIN_SPEED = -5.0  # Задний ход
+MAX_STEPS = 1500  # Тайм-аут эпизода
+END_CAUSES = ("wall", "wrong_way", "lap", "timeout")  # Причины завершения эпизода
+START_STATE_CAPACITY = 256  # Снимков на чекпоинт в StartStateBuffer
+
+# Физика, награды и лидар. RaceSim(params={...}) и CyberRacingEnv(params={...})
+# меняют их для своих машин (например, в sweep.py)
+RACE_PARAMS = {
+    "steering": 0.15,            # Чувствительность руля
+    "acceleration": 0.5,         # Разгон за тик при полном газе
+    "friction": 0.95,            # Трение асфальта (доля скорости после тика)
+    "wrong_way_penalty": -100.0,
+    "wall_penalty": -50.0,
+    "checkpoint_reward": 20.0,
+    "lap_reward": 1000.0,
+    "time_penalty": 0.05,        # Штраф за тик, чтобы не стоял
+    "rays": len(RAY_ANGLES),     # Лучей лидара на 180 градусов
+}
+
+# Снимок машины (get_state/set_state): запись фиксированного размера, 72 байта.
+# Трасса в снимок не входит - он действует на той трассе, где снят
+STATE_DTYPE = np.dtype([
+    ("x", "f8"), ("y", "f8"), ("angle", "f8"), ("speed", "f8"),
+    ("prev_x", "f8"), ("prev_y", "f8"),
+    ("checkpoint", "i8"), ("laps", "i8"), ("steps", "i8"),
+])
+
+
+def race_params(params=None):
+    """RACE_PARAMS с заменами из params и углы лучей лидара. Неизвестный параметр - ValueError."""
+    unknown = set(params or {}) - set(RACE_PARAMS)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры гонки: {sorted(unknown)}")
+    params = {**RACE_PARAMS, **(params or {})}
+    rays = params["rays"]
+    return params, RAY_ANGLES if rays == len(RAY_ANGLES) else np.linspace(-np.pi / 2, np.pi / 2, rays)
+
+
+class RaceSim:
+    """Физика и правила гонки для N машин на одной трассе - только NumPy, без pygame.
+
+    Состояние машин хранится массивами (struct-of-arrays), все проверки
+    считаются векторно. Правила те же, что в CyberRacingEnv.step - одиночная
+    среда считает их скалярно, так для одной машины быстрее.
+    Машины друг другу не мешают (с взаимодействием - traffic.TrafficSim).
+    """
+
+    def __init__(self, track, num_cars=1, lidar="field", action_repeat=1, swept=None, stats=False,
+                 params=None):
+        # Лидар: "field" - точный (по полю расстояний), "legacy" - старый с шагом 10px
+        # (для моделей, обученных на старых лидарах)
+        if lidar not in ("field", "legacy"):
+            raise ValueError(f"Неизвестный режим лидара: {lidar}")
+        if action_repeat < 1:
+            raise ValueError(f"action_repeat должен быть >= 1: {action_repeat}")
+        # Повтор действия и непрерывные проверки - как в CyberRacingEnv
+        self.action_repeat = action_repeat
+        self.swept = action_repeat > 1 if swept is None else swept
+        self.track = track
+        self.field = track.field
+        self.lidar = lidar
+        self.num_cars = num_cars
+        self.params, self.ray_angles = race_params(params)
+        self.obs_size = len(self.ray_angles) + 2  # Лучи, скорость и синус угла
+        # Статистика по фазам и причинам завершения (см. race_stats.py), выключенная ничего не стоит
+        self.stats = None
+        if stats:
+            from race_stats import RaceStats
+            self.stats = RaceStats()
+
+        # Данные машин
+        self.car_pos = np.zeros((num_cars, 2))
+        self.car_angle = np.zeros(num_cars)
+        self.car_speed = np.zeros(num_cars)
+        self.current_checkpoint = np.zeros(num_cars, dtype=np.int64)
+        self.laps = np.zeros(num_cars, dtype=np.int64)
+        self.steps = np.zeros(num_cars, dtype=np.int64)
+        self.prev_pos = np.zeros((num_cars, 2))  # Предыдущая позиция для проверки направления
+        # Где машина закончила последний эпизод - до возврата на старт после езды назад
+        self.end_pos = np.zeros((num_cars, 2))
+        self.end_angle = np.zeros(num_cars)
+        self.reset()
+
+    def _place_at_start(self, mask):
+        self.car_pos[mask] = self.track.start_pos
+        self.car_angle[mask] = self.track.start_angle
+        self.car_speed[mask] = 0.0
+        self.current_checkpoint[mask] = 0
+        self.prev_pos[mask] = self.track.start_pos
+
+    def reset(self, mask=None):
+        """Ставит машины из mask (по умолчанию все) на старт и обнуляет счетчики."""
+        if mask is None:
+            mask = np.ones(self.num_cars, dtype=bool)
+        self._place_at_start(mask)
+        self.laps[mask] = 0
+        self.steps[mask] = 0
+
+    def get_state(self, cars=slice(None)):
+        """Снимки машин cars (по умолчанию всех) - массив STATE_DTYPE."""
+        car_pos = self.car_pos[cars]
+        states = np.empty(len(car_pos), dtype=STATE_DTYPE)
+        states["x"], states["y"] = car_pos[:, 0], car_pos[:, 1]
+        states["angle"] = self.car_angle[cars]
+        states["speed"] = self.car_speed[cars]
+        prev_pos = self.prev_pos[cars]
+        states["prev_x"], states["prev_y"] = prev_pos[:, 0], prev_pos[:, 1]
+        states["checkpoint"] = self.current_checkpoint[cars]
+        states["laps"] = self.laps[cars]
+        states["steps"] = self.steps[cars]
+        return states
+
+    def set_state(self, states, cars=slice(None)):
+        """Восстанавливает машины cars из снимков get_state."""
+        self.car_pos[cars] = np.stack([states["x"], states["y"]], axis=-1)
+        self.car_angle[cars] = states["angle"]
+        self.car_speed[cars] = states["speed"]
+        self.prev_pos[cars] = np.stack([states["prev_x"], states["prev_y"]], axis=-1)
+        self.current_checkpoint[cars] = states["checkpoint"]
+        self.laps[cars] = states["laps"]
+        self.steps[cars] = states["steps"]
+
+    def observe(self, cars=slice(None)):
+        """Наблюдения (N, 9) для машин cars (по умолчанию всех): 7 лучей лидара, скорость и синус угла
+        (лучей может быть другое число - params["rays"])."""
+        stats = self.stats
+        if stats is not None:
+            stats.mark()
+        car_pos = self.car_pos[cars]
+        car_angle = self.car_angle[cars]
+        # Лидары для всех машин и лучей сразу
+        angles = car_angle[:, None] + self.ray_angles[None, :]
+        if self.lidar == "legacy":
+            dist = self.field.cast_rays_legacy(car_pos, angles)
+        else:
+            dist = self.field.cast_rays(car_pos, angles)
+        if stats is not None:
+            stats.lap("lidar")
+            stats.rays += dist.size
+            stats.observations += len(dist)
+
+        rays = len(self.ray_angles)
+        obs = np.empty((len(car_pos), rays + 2), dtype=np.float32)
+        obs[:, :rays] = dist / MAX_RAY_DIST
+        obs[:, rays] = self.car_speed[cars] / MAX_SPEED
+        obs[:, rays + 1] = np.sin(car_angle)
+        return obs
+
+    def step(self, actions):
+        """Один шаг для всех машин: action_repeat тиков физики с одним действием. actions - (N, 2): [руль, газ].
+
+        Возвращает (rewards, terminated), награды за тики суммируются. Машина,
+        завершившая эпизод на промежуточном тике, дальше не едет. Машины после
+        завершения не сбрасываются, кроме езды не в ту сторону - там, как и раньше,
+        машина сразу возвращается на старт (где она была, остается в end_pos / end_angle).
+        """
+        rewards = np.zeros(self.num_cars)
+        terminated = np.zeros(self.num_cars, dtype=bool)
+        if self.stats is not None:
+            self.stats.steps += self.num_cars
+        cars = slice(None)
+        for tick in range(self.action_repeat):
+            if tick > 0:
+                # Дальше едут только машины, у которых эпизод продолжается
+                cars = np.flatnonzero(~terminated)
+                if cars.size == 0:
+                    break
+            tick_rewards, tick_terminated = self._tick(actions[cars], cars)
+            rewards[cars] += tick_rewards
+            terminated[cars] = tick_terminated
+        return rewards, terminated
+
+    def _tick(self, actions, cars):
+        # Один тик физики и проверок для машин cars (срез или массив номеров)
+        stats = self.stats
+        if stats is not None:
+            stats.mark()
+        car_pos = self.car_pos[cars]
+        car_angle = self.car_angle[cars]
+        car_speed = self.car_speed[cars]
+        current_checkpoint = self.current_checkpoint[cars]
+        prev_pos = self.prev_pos[cars]
+        steps = self.steps[cars]
+        laps = self.laps[cars]
+        start_pos = car_pos.copy()
+        n = len(car_pos)
+
+        steering = actions[:, 0]
+        throttle = actions[:, 1]
+        params = self.params
+
+        # Физика
+        car_angle += steering * params["steering"]  # Чувствительность руля
+        car_speed += throttle * params["acceleration"]
+        # Трение и инерция
+        np.clip(car_speed, MIN_SPEED, MAX_SPEED, out=car_speed)
+        car_speed *= params["friction"]  # Трение асфальта
+        # Движение
+        car_pos[:, 0] += np.cos(car_angle) * car_speed
+        car_pos[:, 1] += np.sin(car_angle) * car_speed
+        # Столкновения машин между собой: штрафы (или None, если столкновений не бывает)
+        rewards = self._collide(car_pos, car_speed, cars)
+
+        steps += 1
+        if rewards is None:
+            rewards = np.zeros(n)
+        terminated = np.zeros(n, dtype=bool)
+        if stats is not None:
+            stats.lap("physics")
+            stats.ticks += n
+
+        # 0. Проверка неправильного направления: едет назад или удаляется от следующего чекпоинта
+        next_cp = (current_checkpoint + 1) % len(self.track.checkpoints)
+        to_cp = self.track.checkpoint_centers[next_cp] - car_pos
+        dist_to_cp = np.sqrt(to_cp[:, 0] * to_cp[:, 0] + to_cp[:, 1] * to_cp[:, 1])
+        moving = np.abs(car_speed) > 0.5  # Только если машина движется
+        reversing = moving & (car_speed < 0)
+
+        movement = car_pos - prev_pos
+        move_len = np.sqrt(movement[:, 0] * movement[:, 0] + movement[:, 1] * movement[:, 1])
+        moved = moving & ~reversing & (move_len > 0.1)
+        safe_move = np.where(move_len > 0, move_len, 1.0)
+        safe_dist = np.where(dist_to_cp > 0, dist_to_cp, 1.0)
+        # Скалярное произведение: если < 0, значит движется в противоположную сторону
+        dot = ((movement[:, 0] / safe_move) * (to_cp[:, 0] / safe_dist)
+               + (movement[:, 1] / safe_move) * (to_cp[:, 1] / safe_dist))
+        away = moved & (dot < -0.3) & (dist_to_cp > 100)
+
+        wrong_way = reversing | away
+        rewards[wrong_way] = params["wrong_way_penalty"]  # Большой штраф
+        terminated[wrong_way] = True
+        # Остальные проверки для них не делаем, на старт они встают в конце тика
+
+        alive = ~wrong_way
+        prev_pos[alive] = car_pos[alive]
+        if stats is not None:
+            stats.lap("wrong_way")
+
+        # 1. Проверка столкновения (Стена) - маска под машиной, край экрана тоже стена;
+        # в режиме swept - весь отрезок, пройденный за тик
+        if self.swept:
+            crashed = self.field.hits_wall_along(start_pos, car_pos) & alive
+        else:
+            crashed = self.field.hits_wall(car_pos) & alive
+        rewards[crashed] = params["wall_penalty"]
+        terminated[crashed] = True
+        if stats is not None:
+            stats.lap("wall")
+
+        # 2. Проверка чекпоинтов
+        if self.swept:
+            # Отрезок движения за тик пересекает ворота следующего чекпоинта
+            gates = self.track.gates[next_cp]
+            reached = alive & segments_cross(start_pos[:, 0], start_pos[:, 1], car_pos[:, 0], car_pos[:, 1],
+                                             gates[:, 0, 0], gates[:, 0, 1], gates[:, 1, 0], gates[:, 1, 1])
+        else:
+            # Квадрат машины 20x20 пересекает квадрат чекпоинта (координаты
+            # округляются к нулю, строгие неравенства - как у pygame.Rect.colliderect)
+            car_x = np.trunc(car_pos[:, 0] - 10).astype(np.int64)
+            car_y = np.trunc(car_pos[:, 1] - 10).astype(np.int64)
+            cp = self.track.checkpoints[next_cp]
+            reached = (alive
+                       & (car_x < cp[:, 0] + cp[:, 2]) & (car_x + 20 > cp[:, 0])
+                       & (car_y < cp[:, 1] + cp[:, 3]) & (car_y + 20 > cp[:, 1]))
+        rewards[reached] += params["checkpoint_reward"]
+        current_checkpoint[reached] = next_cp[reached]
+
+        # Если это был последний чекпоинт - значит КРУГ!
+        lap = reached & (current_checkpoint == 0)
+        rewards[lap] += params["lap_reward"]
+        laps[lap] += 1
+        terminated[lap] = True
+
+        # Маленький штраф за время, чтобы не стоял
+        rewards[alive] -= params["time_penalty"]
+
+        timeout = alive & (steps > MAX_STEPS)
+        terminated |= timeout
+
+        if stats is not None:
+            stats.lap("checkpoint")
+            # Одна причина на эпизод: стена важнее круга, круг важнее тайм-аута
+            stats.ends["wrong_way"] += int(np.count_nonzero(wrong_way))
+            stats.ends["wall"] += int(np.count_nonzero(crashed))
+            stats.ends["lap"] += int(np.count_nonzero(lap & ~crashed))
+            stats.ends["timeout"] += int(np.count_nonzero(timeout & ~crashed & ~lap))
+
+        # Записываем состояние обратно (для среза это те же самые массивы)
+        self.car_pos[cars] = car_pos
+        self.car_angle[cars] = car_angle
+        self.car_speed[cars] = car_speed
+        self.current_checkpoint[cars] = current_checkpoint
+        self.prev_pos[cars] = prev_pos
+        self.steps[cars] = steps
+        self.laps[cars] = laps
+        if terminated.any():
+            ended = np.zeros(self.num_cars, dtype=bool)
+            ended[cars] = terminated
+            self.end_pos[ended] = self.car_pos[ended]
+            self.end_angle[ended] = self.car_angle[ended]
+        if wrong_way.any():
+            # Сброс на старт (шаги и круги не трогаем) - через _place_at_start,
+            # как при reset (в TrafficSim - на свое место стартовой решетки)
+            mask = np.zeros(self.num_cars, dtype=bool)
+            mask[cars] = wrong_way
+            self._place_at_start(mask)
+        return rewards, terminated
+
+    def _collide(self, car_pos, car_speed, cars):
+        # Машины проезжают друг сквозь друга
+        return None
+
+
+class StartStateBuffer:
+    """Снимки машин, снятые на чекпоинтах одной трассы, - старты для обучения по частям трассы.
+
+    Для каждого чекпоинта хранится до capacity последних снимков (кольцевой
+    буфер). Чекпоинт для старта выбирается с весом 1 + число аварий после него,
+    поэтому чаще стартуем там, где агент ошибается. Снимки при сэмплировании
+    начинают эпизод заново: шаги и круги обнуляются.
+    """
+
+    def __init__(self, num_checkpoints, capacity=START_STATE_CAPACITY):
+        self.capacity = capacity
+        self.states = np.zeros((num_checkpoints, capacity), dtype=STATE_DTYPE)
+        self.count = np.zeros(num_checkpoints, dtype=np.int64)
+        self.position = np.zeros(num_checkpoints, dtype=np.int64)  # Куда писать следующий снимок
+        self.failures = np.zeros(num_checkpoints, dtype=np.int64)
+
+    def __len__(self):
+        return int(self.count.sum())
+
+    def add(self, states):
+        """Добавляет снимки (один или массив STATE_DTYPE) - каждый к своему чекпоинту."""
+        for state in np.atleast_1d(states):
+            cp = state["checkpoint"]
+            self.states[cp, self.position[cp]] = state
+            self.position[cp] = (self.position[cp] + 1) % self.capacity
+            self.count[cp] = min(self.count[cp] + 1, self.capacity)
+
+    def add_failures(self, checkpoints):
+        """Авария (стена, езда назад) после чекпоинтов checkpoints."""
+        np.add.at(self.failures, np.atleast_1d(checkpoints), 1)
+
+    def sample(self, rng, n=None):
+        """Случайный снимок (или n снимков) для старта. rng - np.random.Generator."""
+        filled = np.flatnonzero(self.count)
+        weights = (self.failures[filled] + 1).astype(np.float64)
+        cps = rng.choice(filled, size=n, p=weights / weights.sum())
+        states = self.states[cps, rng.integers(self.count[cps])].copy()
+        states["steps"] = 0
+        states["laps"] = 0
+        return states
+
+    def save(self, path):
+        np.savez(path, states=self.states, count=self.count, position=self.position, failures=self.failures)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        buffer = cls(data["states"].shape[0], data["states"].shape[1])
+        buffer.states[:] = data["states"]
+        buffer.count[:] = data["count"]
+        buffer.position[:] = data["position"]
+        buffer.failures[:] = data["failures"]
+        return buffer
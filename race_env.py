@@ -1,128 +1,160 @@
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
-import pygame
 import math
 
+from track import Track, TRACK_POINTS, TRACK_SIZE, MAX_RAY_DIST, smooth_track_points, segments_cross
+from track_library import load_track, track_spec
+from race_core import STATE_DTYPE, race_params
+
 class CyberRacingEnv(gym.Env):
-    metadata = {"render_modes": ["human"], "render_fps": 60}
+    """Гоночная среда для одной машины.
+
+    Вся геометрия (маска, поле расстояний, чекпоинты) - в NumPy, pygame
+    загружается лениво и только когда нужна графика: render_mode="human"
+    (окно) или "rgb_array" (кадр в массив без дисплея, для записи видео).
+    """
+
+    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
+
+    # Координаты точек трассы (сложная петля)
+    TRACK_POINTS = TRACK_POINTS
 
-    def __init__(self, render_mode=None):
+    def __init__(self, render_mode=None, lidar="field", field=None, tracks=None,
+                 action_repeat=1, swept=None, stats=False, record=None,
+                 start_states=None, start_state_prob=0.5, params=None):
         super(CyberRacingEnv, self).__init__()
         
-        self.window_width = 1000
-        self.window_height = 800
+        # Лидар: "field" - точный (по полю расстояний), "legacy" - старый с шагом 10px
+        # (для моделей, обученных на старых лидарах)
+        if lidar not in ("field", "legacy"):
+            raise ValueError(f"Неизвестный режим лидара: {lidar}")
+        self.lidar = lidar
+        
+        # Повтор действия: одно решение политики - action_repeat тиков физики
+        if action_repeat < 1:
+            raise ValueError(f"action_repeat должен быть >= 1: {action_repeat}")
+        self.action_repeat = action_repeat
+        # Непрерывные проверки: стена по всему отрезку движения, чекпоинт - пересечение ворот.
+        # По умолчанию включены вместе с повтором действия (без него поведение как раньше)
+        self.swept = action_repeat > 1 if swept is None else swept
+        
+        # Статистика по фазам шага и причинам завершения (для TensorBoard, см. race_stats.py).
+        # Выключенная ничего не стоит: модуль даже не импортируется
+        self.stats = None
+        if stats:
+            from race_stats import RaceStats
+            self.stats = RaceStats()
+        
+        # Запись траектории в бинарный лог (путь к файлу, см. trajectory.py)
+        self.recorder = None
+        if record is not None:
+            from trajectory import TrajectoryWriter
+            self.recorder = TrajectoryWriter(record)
+        
+        self.window_width, self.window_height = TRACK_SIZE
+        if render_mode is not None and render_mode not in self.metadata["render_modes"]:
+            raise ValueError(f"Неизвестный режим отрисовки: {render_mode}")
         self.render_mode = render_mode
-        self.window = None
-        self.clock = None
+        self.renderer = None  # Отрисовка (pygame) создается при первом кадре
+        self.last_obs = None  # Последнее наблюдение - по нему рисуются лучи
         
         # Действия: [Руль (-1..1), Газ (-1..1)]
         self.action_space = spaces.Box(low=np.array([-1, -1]), high=np.array([1, 1]), dtype=np.float32)
         
-        # Наблюдение: 7 лучей + скорость + угол руля
-        self.observation_space = spaces.Box(low=0, high=1, shape=(9,), dtype=np.float32)
+        # Физика, награды и число лучей: race_core.RACE_PARAMS с заменами из params
+        self.params, self.ray_angles = race_params(params)
+        
+        # Наблюдение: 7 лучей (или params["rays"]) + скорость + угол руля
+        self.observation_space = spaces.Box(low=0, high=1, shape=(len(self.ray_angles) + 2,), dtype=np.float32)
 
-        # Генерация трассы (маска коллизий)
-        self.track_surface = pygame.Surface((self.window_width, self.window_height))
-        self.checkpoints = [] # Список прямоугольников-чекпоинтов
-        self._generate_map()
+        # Трасса: маска коллизий, поле расстояний и чекпоинты в NumPy.
+        # Готовое поле (например, общее для всех процессов обучения) заново не рисуется,
+        # иначе трасса открывается из кэша скомпилированных трасс (см. track_library.py)
+        if field is not None:
+            track = Track(self.TRACK_POINTS, field=field)
+        else:
+            track = load_track(track_spec(self.TRACK_POINTS))
+        # Библиотека трасс (TrackLibrary): в reset выбирается одна из них
+        self.tracks = tracks
+        # Старты с чекпоинтов (race_core.StartStateBuffer): в reset с вероятностью
+        # start_state_prob машина ставится в один из снимков, снятых на этой трассе
+        if start_states is not None and tracks is not None:
+            raise ValueError("start_states работает только с одной трассой (без tracks)")
+        self.start_states = start_states
+        self.start_state_prob = start_state_prob
+        self._set_track(track)
         
         # Данные машины
-        self.car_pos = np.array([100.0, 150.0]) # Старт
-        self.car_angle = 0.0
+        self.car_pos = np.array(self.start_pos) # Старт
+        self.car_angle = self.start_angle
         self.car_speed = 0.0
         self.current_checkpoint = 0
         self.laps = 0
-        self.prev_pos = np.array([100.0, 150.0]) # Предыдущая позиция для проверки направления
+        self.prev_pos = np.array(self.start_pos) # Предыдущая позиция для проверки направления
+        self.end_cause = None  # Чем закончился эпизод: "wall", "wrong_way", "lap" или "timeout"
+        self.wrong_way_state = None  # Где машина поехала не туда, до сброса на старт
 
-    def _generate_map(self):
-        # Инициализируем pygame если еще не инициализирован (для работы с Surface)
-        if not pygame.get_init():
-            pygame.init()
-        
-        # Рисуем карту: Черный фон (смерть), Серый асфальт (жизнь)
-        self.track_surface.fill((0, 0, 0))
-        
-        # Координаты точек трассы (сложная петля)
-        points = [
-            (100, 150), (400, 100), (800, 150), # Верхняя прямая
-            (900, 400), (800, 700), # Правый поворот
-            (500, 700), (300, 500), # Петля в центре
-            (600, 400), (500, 250),
-            (200, 300), (100, 600), # Левый низ
-            (50, 400) # Возврат
-        ]
-        
-        # Сглаживаем углы для маски коллизий (используем те же точки, что и для отрисовки)
-        smoothed_points = self._smooth_track_points(points, smoothness=30)
-        
-        # Рисуем широкую дорогу (белый цвет для маски) с закругленными углами
-        pygame.draw.lines(self.track_surface, (255, 255, 255), True, smoothed_points, 140)
-        
-        # Генерируем чекпоинты вдоль линии
-        self.checkpoints = []
-        for i in range(len(points)):
-            p1 = points[i]
-            p2 = points[(i + 1) % len(points)]
-            # Ставим чекпоинт посередине сегмента
-            mid_x = (p1[0] + p2[0]) / 2
-            mid_y = (p1[1] + p2[1]) / 2
-            # Создаем Rect размером 140x140 вокруг точки
-            rect = pygame.Rect(mid_x - 70, mid_y - 70, 140, 140)
-            self.checkpoints.append(rect)
+    def _set_track(self, track):
+        self.track = track
+        self.field = track.field
+        # Чекпоинты (x, y, w, h) - обычные кортежи, в step они проверяются без NumPy
+        self.checkpoints = [tuple(int(v) for v in cp) for cp in track.checkpoints]
+        self.gates = track.gates.tolist()  # Ворота чекпоинтов ((x1, y1), (x2, y2)) для режима swept
+        self.start_pos = track.start_pos
+        self.start_angle = track.start_angle
+        if self.renderer is not None:
+            self.renderer.set_track(track)
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
-        self.car_pos = np.array([100.0, 150.0]) # Координаты первого чекпоинта
-        self.car_angle = 0.0 # Радианы
+        # Выбор трассы: options={"track": номер в библиотеке или готовый Track},
+        # без options - случайная трасса из библиотеки (если она задана)
+        track = (options or {}).get("track")
+        if isinstance(track, Track):
+            self._set_track(track)
+        elif track is not None:
+            self._set_track(self.tracks[track])
+        elif self.tracks is not None:
+            self._set_track(self.tracks[int(self.np_random.integers(len(self.tracks)))])
+        self.car_pos = np.array(self.start_pos) # Координаты первого чекпоинта
+        self.car_angle = self.start_angle # Радианы
         self.car_speed = 0.0
         self.current_checkpoint = 0
         self.laps = 0
         self.steps = 0
-        self.prev_pos = np.array([100.0, 150.0]) # Предыдущая позиция для проверки направления
+        self.prev_pos = np.array(self.start_pos) # Предыдущая позиция для проверки направления
+        self.end_cause = None
         
+        # Старт из снимка: явный options={"state": ...} или случайный из буфера стартов
+        state = (options or {}).get("state")
+        if (state is None and self.start_states is not None and len(self.start_states)
+                and self.np_random.random() < self.start_state_prob):
+            state = self.start_states.sample(self.np_random)
+        if state is not None:
+            self._restore(state)
+        
+        obs = self._get_obs()
         if self.render_mode == "human":
             self._render_frame()
             
-        return self._get_obs(), {}
+        return obs, {}
 
     def _get_obs(self):
-        # 1. Raycasting (лидары)
-        rays = np.linspace(-math.pi/2, math.pi/2, 7) # 7 лучей на 180 градусов
-        readings = []
-        
-        # Оптимизированный raycast: проверяем пиксели на track_surface
-        # Белый (255,255,255) = Дорога, Черный (0,0,0) = Стена
-        
-        for ray_angle in rays:
-            angle = self.car_angle + ray_angle
-            dist = 0
-            max_dist = 200 # Дальность видения
-            
-            # Шагаем по лучу
-            for d in range(5, max_dist, 10): # Шаг 10 пикселей для скорости
-                chk_x = int(self.car_pos[0] + math.cos(angle) * d)
-                chk_y = int(self.car_pos[1] + math.sin(angle) * d)
-                
-                # Если вышли за экран или попали в черное
-                if (chk_x < 0 or chk_x >= self.window_width or 
-                    chk_y < 0 or chk_y >= self.window_height):
-                    dist = d
-                    break
-                
-                # Проверка цвета пикселя (0 = черный)
-                try:
-                    color = self.track_surface.get_at((chk_x, chk_y))[0]
-                    if color < 50: # Стена
-                        dist = d
-                        break
-                except:
-                    dist = d
-                    break
-            else:
-                dist = max_dist
-                
-            readings.append(dist / max_dist)
+        stats = self.stats
+        if stats is not None:
+            stats.mark()
+        # 1. Raycasting (лидары) по полю расстояний трассы
+        angles = self.car_angle + self.ray_angles
+        if self.lidar == "legacy":
+            dists = self.field.cast_rays_legacy(self.car_pos[None], angles[None])[0]
+        else:
+            dists = self.field.cast_rays(self.car_pos[None], angles[None])[0]
+        readings = dists / MAX_RAY_DIST
+        if stats is not None:
+            stats.lap("lidar")
+            stats.rays += len(dists)
+            stats.observations += 1
 
         # Добавляем скорость и данные
         final_obs = np.concatenate([
@@ -130,21 +162,61 @@ class CyberRacingEnv(gym.Env):
             [self.car_speed / 15.0],
             [math.sin(self.car_angle)]
         ], dtype=np.float32)
+        self.last_obs = final_obs
         
         return final_obs
 
     def step(self, action):
-        steering = action[0] 
-        throttle = action[1]
+        # Действия PPO приходят в float32; считаем в float64, как VectorCyberRacingEnv,
+        # иначе угол машины становится float32 и наблюдения расходятся с пачкой
+        steering = float(action[0])
+        throttle = float(action[1])
+        checkpoint = self.current_checkpoint
+        
+        # Одно действие на action_repeat тиков, награды суммируются;
+        # если эпизод закончился на промежуточном тике, дальше не едем
+        reward = 0
+        for _ in range(self.action_repeat):
+            tick_reward, terminated = self._physics_tick(steering, throttle)
+            reward += tick_reward
+            if terminated:
+                break
+            
+        if self.stats is not None:
+            self.stats.steps += 1
+        if self.recorder is not None:
+            self.recorder.add(self, steering, throttle, reward, terminated)
+        if self.start_states is not None:
+            # Снимок на каждом новом чекпоинте, аварии - в вес чекпоинта, после которого случились
+            if terminated:
+                if self.end_cause in ("wall", "wrong_way"):
+                    self.start_states.add_failures(checkpoint)
+            elif self.current_checkpoint != checkpoint:
+                self.start_states.add(self.get_state())
+            
+        obs = self._get_obs()
+        if self.render_mode == "human":
+            self._render_frame()
+            
+        return obs, reward, terminated, False, {}
+
+    def _physics_tick(self, steering, throttle):
+        # Один тик физики и всех проверок. Возвращает (награда, эпизод завершен)
+        stats = self.stats
+        if stats is not None:
+            stats.mark()
+            stats.ticks += 1
+        params = self.params
+        start_x, start_y = self.car_pos.tolist()
         
         # Физика
-        self.car_angle += steering * 0.15 # Чувствительность руля
-        self.car_speed += throttle * 0.5
+        self.car_angle += steering * params["steering"] # Чувствительность руля
+        self.car_speed += throttle * params["acceleration"]
         
         # Трение и инерция
         if self.car_speed > 15: self.car_speed = 15
         if self.car_speed < -5: self.car_speed = -5
-        self.car_speed *= 0.95 # Трение асфальта
+        self.car_speed *= params["friction"] # Трение асфальта
         
         # Движение
         self.car_pos[0] += math.cos(self.car_angle) * self.car_speed
@@ -153,14 +225,15 @@ class CyberRacingEnv(gym.Env):
         self.steps += 1
         reward = 0
         terminated = False
+        if stats is not None:
+            stats.lap("physics")
         
         # 0. Проверка неправильного направления (разворот назад)
         # Проверяем, если машина едет назад (отрицательная скорость) или удаляется от следующего чекпоинта
         if abs(self.car_speed) > 0.5:  # Только если машина движется
             # Получаем следующий чекпоинт
             next_cp_idx = (self.current_checkpoint + 1) % len(self.checkpoints)
-            next_cp_rect = self.checkpoints[next_cp_idx]
-            next_cp_center = np.array([next_cp_rect.centerx, next_cp_rect.centery])
+            next_cp_center = self.track.checkpoint_centers[next_cp_idx]
             
             # Вектор от машины к следующему чекпоинту
             to_checkpoint = next_cp_center - self.car_pos
@@ -169,19 +242,15 @@ class CyberRacingEnv(gym.Env):
             # Вектор движения машины (направление скорости)
             if self.car_speed < 0:  # Едет назад
                 # Если скорость отрицательная - это явный разворот
-                reward = -100  # Большой штраф
+                reward = params["wrong_way_penalty"]  # Большой штраф
                 terminated = True
-                # Сброс на старт
-                self.car_pos = np.array([100.0, 150.0])
-                self.car_angle = 0.0
-                self.car_speed = 0.0
-                self.current_checkpoint = 0
-                self.prev_pos = np.array([100.0, 150.0])
+                self._reset_wrong_way()
+                if stats is not None:
+                    stats.lap("wrong_way")
+                    stats.ends["wrong_way"] += 1
                 
                 # Возвращаемся сразу, чтобы не обрабатывать другие проверки
-                if self.render_mode == "human":
-                    self._render_frame()
-                return self._get_obs(), reward, terminated, False, {}
+                return reward, terminated
             else:
                 # Проверяем, удаляется ли машина от следующего чекпоинта
                 movement = self.car_pos - self.prev_pos
@@ -195,199 +264,144 @@ class CyberRacingEnv(gym.Env):
                     
                     # Если машина удаляется от чекпоинта (и расстояние достаточно большое)
                     if dot_product < -0.3 and dist_to_checkpoint > 100:
-                        reward = -100  # Большой штраф
+                        reward = params["wrong_way_penalty"]  # Большой штраф
                         terminated = True
-                        # Сброс на старт
-                        self.car_pos = np.array([100.0, 150.0])
-                        self.car_angle = 0.0
-                        self.car_speed = 0.0
-                        self.current_checkpoint = 0
-                        self.prev_pos = np.array([100.0, 150.0])
+                        self._reset_wrong_way()
+                        if stats is not None:
+                            stats.lap("wrong_way")
+                            stats.ends["wrong_way"] += 1
                         
                         # Возвращаемся сразу, чтобы не обрабатывать другие проверки
-                        if self.render_mode == "human":
-                            self._render_frame()
-                        return self._get_obs(), reward, terminated, False, {}
+                        return reward, terminated
         
         # Сохраняем текущую позицию для следующего шага
         self.prev_pos = self.car_pos.copy()
+        if stats is not None:
+            stats.lap("wrong_way")
         
         # 1. Проверка столкновения (Стена)
-        # Просто смотрим цвет пикселя под машиной
-        try:
-            cx, cy = int(self.car_pos[0]), int(self.car_pos[1])
-            if self.track_surface.get_at((cx, cy))[0] < 50:
-                reward = -50 # БОЛЬШОЙ ШТРАФ
-                terminated = True
-        except IndexError:
-            reward = -50
+        # Смотрим маску под машиной (край экрана тоже стена), в режиме swept -
+        # весь отрезок, пройденный за тик, чтобы не проскочить сквозь стену
+        if self.swept:
+            crashed = self.field.segment_hits_wall(start_x, start_y, *self.car_pos.tolist())
+        else:
+            crashed = self.field.hits_wall(self.car_pos[None])[0]
+        if crashed:
+            reward = params["wall_penalty"] # БОЛЬШОЙ ШТРАФ
             terminated = True
+        if stats is not None:
+            stats.lap("wall")
             
         # 2. Проверка Чекпоинтов (НАГРАДА ЗА ПРОГРЕСС)
         # Получаем следующий чекпоинт
         next_cp_idx = (self.current_checkpoint + 1) % len(self.checkpoints)
-        next_cp_rect = self.checkpoints[next_cp_idx]
-        
-        # Создаем rect машины
-        car_rect = pygame.Rect(self.car_pos[0]-10, self.car_pos[1]-10, 20, 20)
+        if self.swept:
+            # Отрезок движения за тик пересекает ворота чекпоинта
+            (gx1, gy1), (gx2, gy2) = self.gates[next_cp_idx]
+            reached = segments_cross(start_x, start_y, *self.car_pos.tolist(), gx1, gy1, gx2, gy2)
+        else:
+            cp_x, cp_y, cp_w, cp_h = self.checkpoints[next_cp_idx]
+            
+            # Квадрат машины 20x20 (координаты округляются к нулю, как в pygame.Rect)
+            car_x = int(self.car_pos[0] - 10)
+            car_y = int(self.car_pos[1] - 10)
+            
+            # Пересечение прямоугольников (строгие неравенства, как у colliderect)
+            reached = car_x < cp_x + cp_w and car_x + 20 > cp_x and car_y < cp_y + cp_h and car_y + 20 > cp_y
         
-        if car_rect.colliderect(next_cp_rect):
-            reward += 20 # УРА, ЧЕКПОИНТ!
+        if reached:
+            reward += params["checkpoint_reward"] # УРА, ЧЕКПОИНТ!
             self.current_checkpoint = next_cp_idx
             
             # Если это был последний чекпоинт - значит КРУГ!
             if self.current_checkpoint == 0:
-                reward += 1000 # ФИНИШ!
+                reward += params["lap_reward"] # ФИНИШ!
                 self.laps += 1
                 terminated = True # Заканчиваем эпизод на победе (или можно продолжать)
         
         # Маленький штраф за время, чтобы не стоял
-        reward -= 0.05
+        reward -= params["time_penalty"]
         
-        if self.steps > 1500: # Тайм-аут
+        if self.steps > 1500: # Тайм-аут (в тиках физики, а не в решениях политики)
             terminated = True
             
-        if self.render_mode == "human":
-            self._render_frame()
+        if terminated:
+            # Одна причина на эпизод: стена важнее круга, круг важнее тайм-аута
+            self.end_cause = "wall" if crashed else "lap" if reached and self.current_checkpoint == 0 else "timeout"
+        if stats is not None:
+            stats.lap("checkpoint")
+            if terminated:
+                stats.ends[self.end_cause] += 1
             
-        return self._get_obs(), reward, terminated, False, {}
+        return reward, terminated
 
-    def _smooth_track_points(self, points, smoothness=30):
-        """Добавляет промежуточные точки для закругления углов трассы (Catmull-Rom сплайны)"""
-        if len(points) < 3:
-            return points
-        
-        smoothed = []
-        n = len(points)
-        
-        # Используем Catmull-Rom сплайны для гарантированной непрерывности
-        for i in range(n):
-            p0 = points[(i - 1) % n]  # Предыдущая точка
-            p1 = points[i]  # Текущая точка
-            p2 = points[(i + 1) % n]  # Следующая точка
-            p3 = points[(i + 2) % n]  # Следующая следующая точка
-            
-            # Добавляем промежуточные точки между p1 и p2
-            # Пропускаем первую точку сегмента, чтобы избежать дублирования
-            start_j = 0 if i == 0 else 1
-            for j in range(start_j, smoothness + 1):
-                t = j / smoothness
-                # Catmull-Rom сплайн - гарантирует прохождение через p1 и p2
-                t2 = t * t
-                t3 = t2 * t
-                
-                x = 0.5 * (2*p1[0] + (-p0[0] + p2[0])*t + 
-                          (2*p0[0] - 5*p1[0] + 4*p2[0] - p3[0])*t2 + 
-                          (-p0[0] + 3*p1[0] - 3*p2[0] + p3[0])*t3)
-                y = 0.5 * (2*p1[1] + (-p0[1] + p2[1])*t + 
-                          (2*p0[1] - 5*p1[1] + 4*p2[1] - p3[1])*t2 + 
-                          (-p0[1] + 3*p1[1] - 3*p2[1] + p3[1])*t3)
-                smoothed.append((int(x), int(y)))
-        
-        return smoothed
+    def _reset_wrong_way(self):
+        # Сброс на старт после езды не туда. Где машина была до сброса (позиция, угол,
+        # скорость, чекпоинт) - в wrong_way_state: его пишет запись траектории
+        self.wrong_way_state = (self.car_pos.copy(), self.car_angle, self.car_speed, self.current_checkpoint)
+        self.car_pos = np.array(self.start_pos)
+        self.car_angle = self.start_angle
+        self.car_speed = 0.0
+        self.current_checkpoint = 0
+        self.prev_pos = np.array(self.start_pos)
+        self.end_cause = "wrong_way"
 
-    def _render_frame(self):
-        if self.window is None:
-            if not pygame.get_init():
-                pygame.init()
-            self.window = pygame.display.set_mode((self.window_width, self.window_height))
-            self.clock = pygame.time.Clock()
-            self.font = pygame.font.SysFont("Consolas", 20)
+    def get_state(self):
+        """Снимок машины (запись race_core.STATE_DTYPE, 72 байта). Трасса в снимок не входит."""
+        return np.array((self.car_pos[0], self.car_pos[1], self.car_angle, self.car_speed,
+                         self.prev_pos[0], self.prev_pos[1], self.current_checkpoint, self.laps, self.steps),
+                        dtype=STATE_DTYPE)
 
-        # 1. Отрисовка фона
-        canvas = pygame.Surface((self.window_width, self.window_height))
-        canvas.fill((10, 10, 20)) # Темно-синий фон (Стена/Смерть)
-        
-        # 2. Отрисовка Дороги (Асфальта)
-        # Мы просто берем маску track_surface и используем её как трафарет
-        # Создаем белую поверхность (цвет дороги)
-        road_layer = pygame.Surface((self.window_width, self.window_height))
-        road_layer.fill((40, 40, 50)) # Серый асфальт
-        
-        # Используем BLEND_RGBA_MULT, чтобы наложить маску
-        # track_surface у нас черно-белый (белый=дорога, черный=фон)
-        # Но для простоты: просто отрисуем track_surface поверх, но с нужным цветом
-        # САМЫЙ ПРОСТОЙ СПОСОБ: Заново нарисовать линии дороги серым цветом
-        # (Это дублирование логики, но это 100% работает без магии пикселей)
-        
-        points = [
-            (100, 150), (400, 100), (800, 150), 
-            (900, 400), (800, 700), 
-            (500, 700), (300, 500), 
-            (600, 400), (500, 250),
-            (200, 300), (100, 600), 
-            (50, 400)
-        ]
-        # Сглаживаем углы трассы (больше smoothness для более плавных углов)
-        smoothed_points = self._smooth_track_points(points, smoothness=30)
-        
-        # Рисуем контур трассы (белый контур снаружи)
-        pygame.draw.lines(canvas, (255, 255, 255), True, smoothed_points, 150)  # Белый контур
-        
-        # Рисуем саму трассу (асфальт)
-        pygame.draw.lines(canvas, (40, 40, 50), True, smoothed_points, 140)  # Серый Асфальт
-        pygame.draw.aalines(canvas, (40, 40, 50), True, smoothed_points)  # Сглаженные края для антиалиасинга
-        
-        # Рисуем одну белую полоску разметки по центру
-        pygame.draw.lines(canvas, (255, 255, 255), True, smoothed_points, 2)  # Белая разметка по центру
+    def set_state(self, state):
+        """Восстанавливает машину из снимка get_state и возвращает наблюдение (как reset, но без info)."""
+        self._restore(state)
+        obs = self._get_obs()
+        if self.render_mode == "human":
+            self._render_frame()
+        return obs
 
-        # 3. Рисуем Чекпоинты
-        for i, cp in enumerate(self.checkpoints):
-            # Подсвечиваем только следующий чекпоинт
-            if i == (self.current_checkpoint + 1) % len(self.checkpoints):
-                pygame.draw.rect(canvas, (0, 255, 0), cp, 1) # Зеленая рамка
-            # Остальные не рисуем, чтобы не засорять экран
+    def _restore(self, state):
+        self.car_pos = np.array([float(state["x"]), float(state["y"])])
+        self.car_angle = float(state["angle"])
+        self.car_speed = float(state["speed"])
+        self.prev_pos = np.array([float(state["prev_x"]), float(state["prev_y"])])
+        self.current_checkpoint = int(state["checkpoint"])
+        self.laps = int(state["laps"])
+        self.steps = int(state["steps"])
+        self.end_cause = None
 
-        # 4. Рисуем машину
-        car_surf = pygame.Surface((30, 16), pygame.SRCALPHA)
-        pygame.draw.rect(car_surf, (255, 50, 50), (0, 0, 30, 16), border_radius=4)  # Красный цвет
-        pygame.draw.rect(car_surf, (255, 255, 255), (5, 4, 10, 8)) 
-        
-        rotated_car = pygame.transform.rotate(car_surf, -math.degrees(self.car_angle))
-        rect = rotated_car.get_rect(center=(int(self.car_pos[0]), int(self.car_pos[1])))
-        
-        # Свечение (красное)
-        glow = pygame.transform.scale(rotated_car, (rect.width+10, rect.height+10))
-        glow.fill((100, 0, 0, 50), special_flags=pygame.BLEND_RGBA_ADD)
-        canvas.blit(glow, (rect.x-5, rect.y-5))
-        
-        canvas.blit(rotated_car, rect)
+    def pop_stats(self):
+        """Статистика с прошлого вызова (для RaceStatsCallback); без stats=True - пустой словарь."""
+        if self.stats is None:
+            return {}
+        return self.stats.pop()
 
-        # 5. Лидары (Лучи)
-        obs = self._get_obs()
-        rays = np.linspace(-math.pi/2, math.pi/2, 7)
-        for i, ray_angle in enumerate(rays):
-            # Берем дистанцию из obs (первые 7 элементов)
-            dist_val = obs[i] 
-            
-            angle = self.car_angle + ray_angle
-            dist = dist_val * 200
-            
-            end_x = self.car_pos[0] + math.cos(angle) * dist
-            end_y = self.car_pos[1] + math.sin(angle) * dist
-            
-            # Цвет: Красный если близко (<0.2), иначе Зеленый
-            color = (255, 50, 50) if dist_val < 0.2 else (50, 255, 50)
-            
-            pygame.draw.line(canvas, color, self.car_pos, (end_x, end_y), 1)
-            pygame.draw.circle(canvas, color, (int(end_x), int(end_y)), 3)
+    def _smooth_track_points(self, points, smoothness=30):
+        """Добавляет промежуточные точки для закругления углов трассы (Catmull-Rom сплайны)"""
+        return smooth_track_points(points, smoothness)
 
-        # 6. HUD
-        ui_text = [
-            f"SPEED: {self.car_speed:.1f}",
-            f"CHECKPOINT: {self.current_checkpoint}",
-            f"LAPS: {self.laps}",
-        ]
-        for i, line in enumerate(ui_text):
-            text = self.font.render(line, True, (0, 255, 0))
-            canvas.blit(text, (20, 20 + i * 25))
+    def render(self):
+        """"human" - кадр в окне, "rgb_array" - кадр (высота, ширина, 3) uint8.
 
-        self.window.blit(canvas, (0, 0))
-        pygame.event.pump()
-        pygame.display.update()
-        self.clock.tick(self.metadata["render_fps"])
+        Массив переиспользуется следующим кадром: если кадры нужно хранить, копируйте их.
+        """
+        if self.render_mode is not None:
+            return self._render_frame()
 
+    def _render_frame(self):
+        if self.renderer is None:
+            # pygame импортируется только здесь, headless-среды его не грузят
+            from race_render import RaceRenderer
+            self.renderer = RaceRenderer(self.track, self.metadata["render_fps"], self.render_mode)
+        if self.last_obs is None:
+            self._get_obs()
+        # Лучи берем из наблюдения, уже посчитанного в step/reset
+        return self.renderer.draw(self, self.last_obs)
 
     def close(self):
-        if self.window is not None:
-            pygame.quit()
\ No newline at end of file
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
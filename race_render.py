@@ -0,0 +1,213 @@
+import math
+
+import numpy as np
+import pygame
+
+from track import MAX_RAY_DIST, draw_round_polyline
+
+
+class RaceRenderer:
+    """Отрисовка CyberRacingEnv: окно ("human") или кадр в массив ("rgb_array").
+
+    Модуль импортируется только когда нужна графика, поэтому среды без
+    рендера (обучение, оценка) pygame вообще не загружают.
+
+    Трасса статична, поэтому фон рисуется один раз. В каждом кадре фон
+    возвращается только под тем, что рисовали в прошлый раз (машина, лучи,
+    чекпоинт, HUD), и в окне обновляются только эти прямоугольники.
+    """
+
+    def __init__(self, track, fps, mode="human"):
+        self.fps = fps
+        self.mode = mode
+        self.window_width, self.window_height = track.size
+
+        if mode == "human":
+            if not pygame.get_init():
+                pygame.init()
+            self.window = pygame.display.set_mode((self.window_width, self.window_height))
+            self.canvas = self.window
+            self.clock = pygame.time.Clock()
+        else:
+            # Без окна: рисуем в обычную поверхность, дисплей не нужен
+            self.window = None
+            self.canvas = pygame.Surface((self.window_width, self.window_height))
+            self.clock = None
+            # Кадр (высота, ширина, RGB) - один буфер на все кадры
+            self.frame = np.zeros((self.window_height, self.window_width, 3), dtype=np.uint8)
+        if not pygame.font.get_init():
+            pygame.font.init()
+        self.font = pygame.font.SysFont("Consolas", 20)
+
+        self.set_track(track)
+
+        # Машина (без поворота) тоже рисуется один раз, для каждого цвета своя
+        self.car_surfs = {}
+        self.car_surf = self.car_surface((255, 50, 50))  # Красный цвет
+
+    def car_surface(self, color):
+        """Спрайт машины цвета color (кэшируется)."""
+        surf = self.car_surfs.get(color)
+        if surf is None:
+            surf = pygame.Surface((30, 16), pygame.SRCALPHA)
+            pygame.draw.rect(surf, color, (0, 0, 30, 16), border_radius=4)
+            pygame.draw.rect(surf, (255, 255, 255), (5, 4, 10, 8))
+            self.car_surfs[color] = surf
+        return surf
+
+    def set_track(self, track):
+        """Новая трасса: фон перерисовывается один раз, следующий кадр - целиком."""
+        self.track = track
+        self.background = self._draw_background()
+        if self.window is not None:
+            self.background = self.background.convert()
+        self.dirty = None  # Прямоугольники прошлого кадра (None - нужен полный кадр)
+
+    def _draw_background(self):
+        # 1. Отрисовка фона
+        background = pygame.Surface((self.window_width, self.window_height))
+        background.fill((10, 10, 20)) # Темно-синий фон (Стена/Смерть)
+
+        # 2. Отрисовка Дороги (Асфальта) по сглаженным точкам трассы
+        smoothed_points = self.track.smoothed
+        if self.track.raster == "round":
+            # Сгенерированная трасса: рисуем той же растеризацией, что и маску, иначе
+            # pygame.draw.lines оставит на диагоналях полосы "стены" посреди дороги
+            return self._draw_round_background(background)
+
+        # Рисуем контур трассы (белый контур снаружи)
+        pygame.draw.lines(background, (255, 255, 255), True, smoothed_points, 150)  # Белый контур
+
+        # Рисуем саму трассу (асфальт)
+        pygame.draw.lines(background, (40, 40, 50), True, smoothed_points, 140)  # Серый Асфальт
+        pygame.draw.aalines(background, (40, 40, 50), True, smoothed_points)  # Сглаженные края для антиалиасинга
+
+        # Рисуем одну белую полоску разметки по центру
+        pygame.draw.lines(background, (255, 255, 255), True, smoothed_points, 2)  # Белая разметка по центру
+        return background
+
+    def _draw_round_background(self, background):
+        width, height = self.track.size
+        border = np.zeros((height, width), dtype=bool)
+        draw_round_polyline(border, self.track.smoothed, self.track.width + 10)  # Белый контур
+        center = np.zeros((height, width), dtype=bool)
+        draw_round_polyline(center, self.track.smoothed, 2)  # Белая разметка по центру
+        pixels = np.empty((height, width, 3), dtype=np.uint8)
+        pixels[:] = (10, 10, 20)
+        pixels[border] = (255, 255, 255)
+        pixels[~self.track.field.wall] = (40, 40, 50)  # Асфальт - ровно там, где маска дороги
+        pixels[center] = (255, 255, 255)
+        pygame.surfarray.blit_array(background, pixels.transpose(1, 0, 2))
+        return background
+
+    def draw(self, env, obs):
+        """Рисует кадр по состоянию среды; лучи берутся из obs, а не считаются заново.
+
+        В режиме "rgb_array" возвращает кадр (высота, ширина, 3). Это один и тот же
+        буфер: следующий кадр его перезапишет, поэтому для хранения делайте копию.
+        """
+        canvas = self.canvas
+        rects = self._begin_frame()
+
+        # 3. Рисуем Чекпоинты
+        # Подсвечиваем только следующий чекпоинт, остальные не рисуем, чтобы не засорять экран
+        checkpoints = self.track.checkpoints
+        next_cp = (env.current_checkpoint + 1) % len(checkpoints)
+        rects.append(pygame.draw.rect(canvas, (0, 255, 0), [int(v) for v in checkpoints[next_cp]], 1)) # Зеленая рамка
+
+        # 4. Рисуем машину
+        self._draw_car(self.car_surf, env.car_pos[0], env.car_pos[1], env.car_angle, rects)
+
+        # 5. Лидары (Лучи)
+        for i, ray_angle in enumerate(env.ray_angles):
+            # Берем дистанцию из obs (первые 7 элементов или params["rays"])
+            dist_val = obs[i]
+
+            angle = env.car_angle + ray_angle
+            dist = dist_val * MAX_RAY_DIST
+
+            end_x = env.car_pos[0] + math.cos(angle) * dist
+            end_y = env.car_pos[1] + math.sin(angle) * dist
+
+            # Цвет: Красный если близко (<0.2), иначе Зеленый
+            color = (255, 50, 50) if dist_val < 0.2 else (50, 255, 50)
+
+            rects.append(pygame.draw.line(canvas, color, env.car_pos, (end_x, end_y), 1))
+            rects.append(pygame.draw.circle(canvas, color, (int(end_x), int(end_y)), 3))
+
+        # 6. HUD
+        ui_text = [
+            f"SPEED: {env.car_speed:.1f}",
+            f"CHECKPOINT: {env.current_checkpoint}",
+            f"LAPS: {env.laps}",
+        ]
+        self._draw_hud([(line, (0, 255, 0)) for line in ui_text], rects)
+        return self._finish_frame(rects)
+
+    def draw_cars(self, cars, hud):
+        """Кадр с несколькими машинами (гонка призраков): cars - список (x, y, угол, цвет),
+        hud - строки (текст, цвет). Лучи и чекпоинты не рисуются. Возвращает то же, что draw.
+        """
+        rects = self._begin_frame()
+        for x, y, angle, color in cars:
+            self._draw_car(self.car_surface(color), x, y, angle, rects)
+        self._draw_hud(hud, rects)
+        return self._finish_frame(rects)
+
+    def _begin_frame(self):
+        # Стираем прошлый кадр: возвращаем фон под его прямоугольниками
+        if self.dirty is None:
+            self.canvas.blit(self.background, (0, 0))
+        else:
+            for rect in self.dirty:
+                self.canvas.blit(self.background, rect, rect)
+        return []
+
+    def _draw_car(self, car_surf, x, y, angle, rects):
+        rotated_car = pygame.transform.rotate(car_surf, -math.degrees(angle))
+        rect = rotated_car.get_rect(center=(int(x), int(y)))
+
+        # Свечение (красное)
+        glow = pygame.transform.scale(rotated_car, (rect.width+10, rect.height+10))
+        glow.fill((100, 0, 0, 50), special_flags=pygame.BLEND_RGBA_ADD)
+        rects.append(self.canvas.blit(glow, (rect.x-5, rect.y-5)))
+
+        rects.append(self.canvas.blit(rotated_car, rect))
+
+    def _draw_hud(self, lines, rects):
+        for i, (line, color) in enumerate(lines):
+            text = self.font.render(line, True, color)
+            rects.append(self.canvas.blit(text, (20, 20 + i * 25)))
+
+    def _finish_frame(self, rects):
+        canvas = self.canvas
+        if self.window is not None:
+            pygame.event.pump()
+            if self.dirty is None:
+                pygame.display.update()
+            else:
+                # Обновляем на экране и старые места (там теперь фон), и новые
+                pygame.display.update(self.dirty + rects)
+            self.dirty = rects
+            self.clock.tick(self.fps)
+            return None
+
+        # В буфер кадра тоже копируем только изменившиеся прямоугольники
+        if self.dirty is None:
+            changed = [canvas.get_rect()]
+        else:
+            changed = self.dirty + rects
+        self.dirty = rects
+        bounds = canvas.get_rect()
+        for rect in changed:
+            rect = rect.clip(bounds)
+            if rect.width and rect.height:
+                pygame.pixelcopy.surface_to_array(
+                    self.frame[rect.top:rect.bottom, rect.left:rect.right].transpose(1, 0, 2),
+                    canvas.subsurface(rect),
+                )
+        return self.frame
+
+    def close(self):
+        if self.window is not None:
+            pygame.quit()
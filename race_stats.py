@@ -0,0 +1,87 @@
+import time
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+from race_core import END_CAUSES
+
+PHASES = ("physics", "wrong_way", "wall", "checkpoint", "lidar")  # Фазы шага, по которым копится время
+
+
+class RaceStats:
+    """Счетчики и время по фазам шага среды (включается параметром stats=True).
+
+    Внутри шага только прибавления к числам, сводка собирается в pop() раз
+    за rollout. Модуль импортируется средой только когда статистика включена,
+    а выключенная статистика стоит одной проверки на None в каждой фазе.
+    """
+
+    def __init__(self):
+        self.clock = time.perf_counter
+        self._last = 0.0
+        self.clear()
+
+    def clear(self):
+        self.steps = 0  # Решения политики
+        self.ticks = 0  # Тики физики (машино-тики для пачки)
+        self.rays = 0   # Лучи лидара
+        self.observations = 0  # Наблюдения (лучей в каждом столько, сколько у среды: params["rays"])
+        self.ends = dict.fromkeys(END_CAUSES, 0)
+        self.time = dict.fromkeys(PHASES, 0.0)
+
+    def mark(self):
+        """Начало отсчета для следующей фазы."""
+        self._last = self.clock()
+
+    def lap(self, phase):
+        """Время с прошлой отметки уходит в фазу phase, отсчет начинается заново."""
+        now = self.clock()
+        self.time[phase] += now - self._last
+        self._last = now
+
+    def pop(self):
+        """Сводка за время с прошлого вызова (плоский словарь), счетчики обнуляются."""
+        summary = {"steps": self.steps, "ticks": self.ticks, "rays": self.rays, "observations": self.observations}
+        for cause, count in self.ends.items():
+            summary[f"end_{cause}"] = count
+        for phase, seconds in self.time.items():
+            summary[f"time_{phase}"] = seconds
+        self.clear()
+        return summary
+
+
+def merge_stats(summaries):
+    """Складывает сводки нескольких сред (пустой словарь - среда без статистики)."""
+    total = {}
+    for summary in summaries:
+        for key, value in summary.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class RaceStatsCallback(BaseCallback):
+    """Публикует статистику сред в TensorBoard в конце каждого rollout.
+
+    С SubprocVecEnv сводки собираются через env_method("pop_stats") (статистика
+    копится в воркерах), у VectorCyberRacingEnv сводка одна на всю пачку.
+    Время фаз пишется в микросекундах на тик (лидар - на наблюдение).
+    """
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        # env_method пачки вернул бы одну и ту же сводку для каждой машины
+        pop_stats = getattr(self.training_env, "pop_stats", None)
+        stats = pop_stats() if pop_stats is not None else merge_stats(self.training_env.env_method("pop_stats"))
+        if not stats.get("steps"):
+            return
+        ticks = max(stats["ticks"], 1)
+        observations = max(stats["observations"], 1)
+        self.logger.record("race/steps", stats["steps"])
+        self.logger.record("race/ticks", stats["ticks"])
+        self.logger.record("race/rays", stats["rays"])
+        for cause in END_CAUSES:
+            self.logger.record(f"race/end_{cause}", stats[f"end_{cause}"])
+        for phase in PHASES:
+            per = observations if phase == "lidar" else ticks
+            self.logger.record(f"race_time/{phase}_us", stats[f"time_{phase}"] / per * 1e6)
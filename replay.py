@@ -0,0 +1,142 @@
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+from race_core import END_CAUSES
+from track import RAY_ANGLES, MAX_RAY_DIST
+from trajectory import Trajectory
+
+# Настройки
+REPLAY_FPS = 60
+SEEK_STEP = 60                    # На сколько записей прыгают стрелки во время проигрывания
+FAILURES = ("wall", "wrong_way")  # Куда прыгает клавиша F
+LEAD_IN = 90                      # Сколько записей показать перед концом эпизода при прыжке к аварии
+
+CONTROLS = """Управление:
+  Пробел - пауза, стрелки влево/вправо - запись назад/вперед (при проигрывании - на секунду)
+  Вверх/вниз - быстрее/медленнее, N/P - следующий/предыдущий эпизод
+  F - следующий эпизод, закончившийся аварией (стена или езда назад), Home/End - начало/конец лога"""
+
+
+def summary(log):
+    """Сводка по логу без окна: эпизоды, причины завершения, награды."""
+    records = log.records
+    starts, ends = log.episodes[:, 0], log.episodes[:, 1]
+    print(f"Записей: {len(log)}, эпизодов: {len(starts)}, трасс: {len(log.meta['tracks'])}")
+    if not len(starts):
+        return
+    rewards = np.add.reduceat(records["reward"].astype(np.float64), starts)
+    lengths = ends - starts
+    print(f"Награда за эпизод: средняя {rewards.mean():.1f}, мин {rewards.min():.1f}, макс {rewards.max():.1f}")
+    print(f"Длина эпизода: средняя {lengths.mean():.0f} шагов")
+    for cause in END_CAUSES:
+        episodes = log.find(cause)
+        first = ", ".join(str(e) for e in episodes[:10])
+        print(f"  {cause:10s} {len(episodes):8d}" + (f"   (эпизоды {first}{' ...' if len(episodes) > 10 else ''})"
+                                                   if len(episodes) else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Просмотр записанных траекторий CyberRace")
+    parser.add_argument("path", help="Лог траектории (запись через CyberRacingEnv(record=...))")
+    parser.add_argument("--episode", type=int, default=0, help="С какого эпизода начать")
+    parser.add_argument("--find", choices=END_CAUSES, help="Показывать только эпизоды с этой причиной завершения")
+    parser.add_argument("--summary", action="store_true", help="Только сводка, без окна")
+    args = parser.parse_args()
+
+    log = Trajectory(args.path)
+    summary(log)
+    if args.summary or not len(log):
+        return
+
+    # Список эпизодов для просмотра: все или только с нужной причиной завершения
+    episodes = log.find(args.find) if args.find else np.arange(len(log.episodes))
+    if not len(episodes):
+        print(f"Эпизодов с причиной {args.find} нет")
+        return
+    print(CONTROLS)
+
+    import pygame
+    from race_render import RaceRenderer
+
+    def seek_episode(number):
+        # Номер в списке эпизодов -> первая запись эпизода
+        return int(log.episodes[episodes[number % len(episodes)], 0])
+
+    index = seek_episode(min(args.episode, len(episodes) - 1))
+    track = log.track(index)
+    renderer = RaceRenderer(track, REPLAY_FPS)
+    state = SimpleNamespace(car_pos=np.zeros(2), car_angle=0.0, car_speed=0.0, current_checkpoint=0, laps=0,
+                            ray_angles=RAY_ANGLES)
+    speed = 1.0
+    position = float(index)  # Дробная позиция - для проигрывания медленнее одной записи за кадр
+    playing = True
+
+    try:
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                if event.type != pygame.KEYDOWN:
+                    continue
+                episode = log.episode_of(index)
+                if event.key == pygame.K_SPACE:
+                    playing = not playing
+                elif event.key in (pygame.K_RIGHT, pygame.K_LEFT):
+                    step = SEEK_STEP if playing else 1
+                    position = index + (step if event.key == pygame.K_RIGHT else -step)
+                elif event.key == pygame.K_UP:
+                    speed = min(speed * 2, 32.0)
+                elif event.key == pygame.K_DOWN:
+                    speed = max(speed / 2, 1 / 16)
+                elif event.key in (pygame.K_n, pygame.K_p):
+                    # Соседний эпизод в списке просмотра (последний из списка, что не позже текущего, +-1)
+                    number = int(np.searchsorted(episodes, episode, side="right")) - 1
+                    number = number + 1 if event.key == pygame.K_n else max(number - 1, 0)
+                    position = seek_episode(number)
+                elif event.key == pygame.K_f:
+                    failed = np.concatenate([log.find(cause) for cause in FAILURES])
+                    later = np.sort(failed[failed > episode])
+                    if len(later):
+                        end = int(log.episodes[later[0], 1])
+                        position = max(end - LEAD_IN, int(log.episodes[later[0], 0]))
+                elif event.key == pygame.K_HOME:
+                    position = 0
+                elif event.key == pygame.K_END:
+                    position = len(log) - 1
+
+            index = int(np.clip(position, 0, len(log) - 1))
+            position = min(max(position, 0), len(log) - 1)
+            record = log.records[index]
+
+            new_track = log.track(index)
+            if new_track is not track:
+                track = new_track
+                renderer.set_track(track)
+
+            state.car_pos[:] = (record["x"], record["y"])
+            state.car_angle = float(record["angle"])
+            state.car_speed = float(record["speed"])
+            state.current_checkpoint = int(record["checkpoint"])
+            state.laps = int(record["laps"])
+            # Лидары не записываются - считаем их по трассе заново (только для картинки)
+            angles = state.car_angle + RAY_ANGLES
+            obs = track.field.cast_rays(state.car_pos[None], angles[None])[0] / MAX_RAY_DIST
+
+            episode = log.episode_of(index)
+            start, end = log.episodes[episode]
+            total = float(log.records["reward"][start:index + 1].sum())
+            cause = log.end_cause(episode) if index == end - 1 else None
+            pygame.display.set_caption(
+                f"Replay - эпизод {episode} шаг {index - start + 1}/{end - start}  награда {total:.1f}"
+                f"  x{speed:g}{'  ПАУЗА' if not playing else ''}{f'  КОНЕЦ: {cause}' if cause else ''}")
+            renderer.draw(state, obs)
+
+            if playing:
+                position += speed
+    finally:
+        renderer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import itertools
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from evaluate import save_json
+from race_core import END_CAUSES
+
+# Настройки
+SWEEP_DIR = "sweeps"          # Модели, логи TensorBoard и итоги прогонов
+TRIAL_STEPS = 300_000         # Шагов обучения на прогон
+REPORT_STEPS = 30_000         # Через сколько шагов прогон сообщает долю кругов и решает, не остановиться ли
+ENVS_PER_TRIAL = 64           # Машин в пачке VectorCyberRacingEnv одного прогона
+EARLY_STOP_AFTER = 3          # Останавливать не раньше стольких отчетов
+EARLY_STOP_MARGIN = 0.1       # Отставание от медианы других прогонов (доля кругов), после которого прогон останавливается
+EARLY_STOP_PEERS = 2          # Сколько других прогонов должно дойти до этой точки, чтобы сравнивать
+SEEDS = [0, 1]
+
+# Пространство поиска: параметры PPO и параметры гонки (env.* - race_core.RACE_PARAMS)
+SEARCH_SPACE = {
+    "learning_rate": [1e-4, 3e-4, 1e-3],
+    "n_steps": [64, 128],
+    "ent_coef": [0.0, 0.01],
+    "gamma": [0.99, 0.995],
+    "env.lap_reward": [500.0, 1000.0],
+    "env.steering": [0.1, 0.15],
+    "env.rays": [5, 7, 9],
+}
+
+
+def parse_value(text):
+    # Число, если похоже на число, иначе строка
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def make_trials(space, seeds, mode, count, rng_seed=0):
+    """Список прогонов: сетка - все сочетания, random - count случайных разных сочетаний; каждый на всех seeds."""
+    names = sorted(space)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    if mode == "random":
+        rng = random.Random(rng_seed)
+        combos = rng.sample(combos, min(count, len(combos)))
+    trials = []
+    for number, (params, seed) in enumerate((p, s) for p in combos for s in seeds):
+        trials.append({"id": f"trial{number:03d}", "params": params, "seed": seed})
+    return trials
+
+
+def split_cores(num_trials, workers=None, cpus=None):
+    """Сколько прогонов идет одновременно и сколько ядер (потоков torch) у каждого."""
+    cpus = cpus or os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, num_trials))
+    return workers, max(1, cpus // workers)
+
+
+def should_stop(curve, peers, report):
+    """Правило медианы: прогон заметно отстает от медианы других прогонов в той же точке."""
+    if report < EARLY_STOP_AFTER:
+        return False
+    others = [c[report - 1]["lap_rate"] for c in peers if len(c) >= report]
+    if len(others) < EARLY_STOP_PEERS:
+        return False
+    return curve[report - 1]["lap_rate"] < float(np.median(others)) - EARLY_STOP_MARGIN
+
+
+def run_trial(trial, settings, progress):
+    """Один прогон (выполняется в процессе пула). progress - общий словарь кривых всех прогонов."""
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import VecMonitor
+
+    from vec_race_env import VectorCyberRacingEnv
+
+    torch.set_num_threads(settings["threads"])
+    ppo_params = {k: v for k, v in trial["params"].items() if not k.startswith("env.")}
+    env_params = {k[4:]: v for k, v in trial["params"].items() if k.startswith("env.")}
+
+    # Статистика среды дает причины завершения эпизодов - по ним считается доля кругов
+    raw_env = VectorCyberRacingEnv(settings["envs"], stats=True, params=env_params)
+    raw_env.seed(trial["seed"])
+    env = VecMonitor(raw_env)
+    model = PPO("MlpPolicy", env, seed=trial["seed"], device="cpu", verbose=0,
+                tensorboard_log=os.path.join(settings["dir"], "logs"), **ppo_params)
+    # Лидар и параметры гонки сохраняются в zip модели: evaluate.py, ghost_race.py и play_race.py --resume их читают
+    model.race_config = {"lidar": raw_env.sim.lidar, "params": env_params}
+
+    curve = []
+    status = "done"
+    started = time.perf_counter()
+    while model.num_timesteps < settings["steps"]:
+        model.learn(settings["report_steps"], reset_num_timesteps=False, tb_log_name=trial["id"])
+        stats = raw_env.pop_stats()
+        ends = sum(stats[f"end_{cause}"] for cause in END_CAUSES)
+        rewards = [info["r"] for info in model.ep_info_buffer]
+        curve.append({"step": int(model.num_timesteps),
+                      "lap_rate": stats["end_lap"] / ends if ends else 0.0,
+                      "mean_reward": float(np.mean(rewards)) if rewards else None})
+        progress[trial["id"]] = curve
+        peers = [c for key, c in progress.items() if key != trial["id"]]
+        if should_stop(curve, peers, len(curve)):
+            status = "stopped"
+            break
+
+    model.save(os.path.join(settings["dir"], "models", trial["id"]))
+    env.close()
+    last = curve[-1]
+    return {**trial, "status": status, "steps": last["step"], "lap_rate": last["lap_rate"],
+            "mean_reward": last["mean_reward"], "best_lap_rate": max(c["lap_rate"] for c in curve),
+            "seconds": time.perf_counter() - started, "curve": curve}
+
+
+def results_table(results):
+    """Сначала доля кругов в конце прогона, затем средняя награда."""
+    return sorted(results, key=lambda r: (-r["lap_rate"], -(r["mean_reward"] if r["mean_reward"] is not None
+                                                            else -float("inf"))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор seed и гиперпараметров обучения CyberRace")
+    parser.add_argument("--mode", choices=["grid", "random"], default="random", help="Полная сетка или случайные сочетания")
+    parser.add_argument("--trials", type=int, default=8, help="Сколько сочетаний взять в режиме random")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="Значения параметра (PPO или env.<параметр гонки>); если заданы - вместо SEARCH_SPACE")
+    parser.add_argument("--seeds", default=",".join(map(str, SEEDS)), help="Seed через запятую")
+    parser.add_argument("--steps", type=int, default=TRIAL_STEPS, help="Шагов обучения на прогон")
+    parser.add_argument("--report-steps", type=int, default=REPORT_STEPS, help="Шагов между отчетами прогона")
+    parser.add_argument("--envs", type=int, default=ENVS_PER_TRIAL, help="Машин в пачке одного прогона")
+    parser.add_argument("--workers", type=int, default=None, help="Прогонов одновременно (по умолчанию по ядрам)")
+    parser.add_argument("--out", default=SWEEP_DIR, help="Папка прогона")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать список прогонов")
+    args = parser.parse_args()
+
+    space = SEARCH_SPACE
+    if args.param:
+        space = {}
+        for item in args.param:
+            name, _, values = item.partition("=")
+            space[name] = [parse_value(v) for v in values.split(",")]
+    seeds = [int(s) for s in args.seeds.split(",")]
+    trials = make_trials(space, seeds, args.mode, args.trials)
+    workers, threads = split_cores(len(trials), args.workers)
+    print(f"Прогонов: {len(trials)}, одновременно: {workers}, потоков torch на прогон: {threads}, "
+          f"машин в пачке: {args.envs}")
+    if args.dry_run:
+        for trial in trials:
+            print(f"  {trial['id']} seed {trial['seed']}: {trial['params']}")
+        return
+
+    os.makedirs(os.path.join(args.out, "models"), exist_ok=True)
+    settings = {"steps": args.steps, "report_steps": args.report_steps, "envs": args.envs,
+                "threads": threads, "dir": args.out}
+    summary_path = os.path.join(args.out, "summary.json")
+    results = []
+    with mp.Manager() as manager:
+        progress = manager.dict()
+        # Как в evaluate.py: на Linux fork
+        ctx = mp.get_context("fork" if sys.platform.startswith("linux") else None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = {pool.submit(run_trial, trial, settings, progress): trial for trial in trials}
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                save_json({"settings": settings, "space": space, "results": results_table(results)}, summary_path)
+                print(f"  {result['id']} ({result['status']}, {result['steps']} шагов): "
+                      f"круги {result['lap_rate']:.0%}")
+
+    print(f"\n{'#':>3} {'прогон':9s} {'seed':>4} {'круги':>6} {'лучшее':>7} {'награда':>9} {'шагов':>8} {'':8s} параметры")
+    for place, row in enumerate(results_table(results), 1):
+        reward = f"{row['mean_reward']:.1f}" if row["mean_reward"] is not None else "-"
+        params = " ".join(f"{k}={v}" for k, v in row["params"].items())
+        print(f"{place:>3} {row['id']:9s} {row['seed']:>4} {row['lap_rate']:>6.0%} {row['best_lap_rate']:>7.0%} "
+              f"{reward:>9} {row['steps']:>8} {row['status']:8s} {params}")
+    print(f"Итоги: {summary_path}")
+
+if __name__ == "__main__":
+    main()
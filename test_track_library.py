@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from track_library import generate_track, load_track
+
+# Настройки
+SEEDS = range(100, 106)
+MARGIN = 3  # Сколько пикселей поле расстояний может недобрать до width / 2 (дискретизация)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_generated_centerline_is_clear(seed, tmp_path):
+    # Вдоль всей осевой линии до стены не меньше полуширины: на диагоналях нет полос "стены"
+    track = load_track(generate_track(seed), cache_dir=tmp_path)
+    points = np.asarray(track.smoothed).round().astype(int)
+    distance = track.field.distance[points[:, 1] + 1, points[:, 0] + 1]  # Поле с рамкой в 1 пиксель
+    assert distance.min() >= track.width / 2 - MARGIN
@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+import pytest
+
+from track import MAX_RAY_DIST
+from track_library import load_track
+from traffic import BUMP_PENALTY, BUMP_SPEED, CAR_RADIUS, SpatialHash, TrafficSim
+
+# Настройки
+NUM_CARS = 24
+CARS_PER_RACE = 8   # Три заезда на одной трассе
+SEEDS = range(5)
+
+
+def random_sim(seed, spread=300.0):
+    # Машины кучей в квадрате spread (много соседей и касаний), часть убрана с трассы
+    rng = np.random.default_rng(seed)
+    sim = TrafficSim(load_track(), num_cars=NUM_CARS, cars_per_race=CARS_PER_RACE)
+    sim.car_pos[:] = rng.uniform(200, 200 + spread, (NUM_CARS, 2))
+    sim.car_angle[:] = rng.uniform(-math.pi, math.pi, NUM_CARS)
+    sim.car_speed[:] = rng.uniform(0, 5, NUM_CARS)
+    sim.active[:] = rng.random(NUM_CARS) < 0.75
+    return sim, rng
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_spatial_hash_finds_all_neighbours_once(seed):
+    rng = np.random.default_rng(seed)
+    size, layers, radius = (1000, 800), 3, 90.0
+    points = rng.uniform(-50, 1050, (300, 2))  # Есть и точки за краем карты
+    layer = rng.integers(0, layers, len(points))
+    items = np.flatnonzero(rng.random(len(points)) < 0.7)
+    grid = SpatialHash(size, layers=layers)
+    grid.build(points, items, layer[items])
+    owner, item = grid.query(points, radius, layer)
+
+    pairs = list(zip(owner.tolist(), item.tolist()))
+    assert len(pairs) == len(set(pairs))  # Каждая пара - один раз
+    assert np.all(layer[owner] == layer[item])
+    assert np.all(np.isin(item, items))
+    for i in range(len(points)):
+        delta = points[items] - points[i]
+        near = items[((delta ** 2).sum(axis=1) <= radius * radius) & (layer[items] == layer[i])]
+        assert set(near.tolist()) <= {b for a, b in pairs if a == i}
+
+
+def brute_force_rays(sim, cars):
+    dist = np.full((len(cars), len(sim.ray_angles)), float(MAX_RAY_DIST))
+    for row, i in enumerate(cars):
+        for k, ray_angle in enumerate(sim.ray_angles):
+            angle = sim.car_angle[i] + ray_angle
+            dx, dy = math.cos(angle), math.sin(angle)
+            for j in range(sim.num_cars):
+                if j == i or not sim.active[j] or sim.race[j] != sim.race[i]:
+                    continue
+                rx, ry = sim.car_pos[j] - sim.car_pos[i]
+                along = rx * dx + ry * dy
+                perp2 = rx * rx + ry * ry - along * along
+                if perp2 > CAR_RADIUS * CAR_RADIUS:
+                    continue
+                half = math.sqrt(CAR_RADIUS * CAR_RADIUS - perp2)
+                if along + half < 0:
+                    continue
+                dist[row, k] = min(dist[row, k], max(along - half, 0.0))
+    return dist
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_car_rays_match_brute_force(seed):
+    sim, rng = random_sim(seed)
+    assert np.allclose(sim.cast_car_rays(), brute_force_rays(sim, range(NUM_CARS)))
+    cars = np.sort(rng.choice(NUM_CARS, 10, replace=False))
+    assert np.allclose(sim.cast_car_rays(cars), brute_force_rays(sim, cars))
+    # Лучи что-то видят, иначе сравнение ничего не проверяет
+    assert (sim.cast_car_rays() < MAX_RAY_DIST).any()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_collide_matches_brute_force(seed):
+    sim, rng = random_sim(seed, spread=150.0)
+    cars = np.sort(rng.choice(NUM_CARS, 16, replace=False))  # Остальные машины на этом тике стоят
+    car_pos = sim.car_pos[cars] + rng.uniform(-3, 3, (len(cars), 2))
+    car_speed = sim.car_speed[cars].copy()
+
+    pos = sim.car_pos.copy()
+    pos[cars] = car_pos
+    moving = np.isin(np.arange(NUM_CARS), cars)
+    push = np.zeros((NUM_CARS, 2))
+    bumped = np.zeros(NUM_CARS, dtype=bool)
+    for a in range(NUM_CARS):
+        for b in range(a + 1, NUM_CARS):
+            if not (sim.active[a] and sim.active[b]) or sim.race[a] != sim.race[b]:
+                continue
+            delta = pos[b] - pos[a]
+            dist = math.hypot(delta[0], delta[1])
+            if dist >= 2 * CAR_RADIUS:
+                continue
+            overlap = (2 * CAR_RADIUS - dist) * delta / dist
+            push[a] -= overlap * (0.5 if moving[b] else 1.0) * moving[a]
+            push[b] += overlap * (0.5 if moving[a] else 1.0) * moving[b]
+            bumped[a] = bumped[b] = True
+    expected_pos = car_pos + push[cars]
+    expected_speed = np.where(bumped[cars], car_speed * BUMP_SPEED, car_speed)
+    expected_rewards = np.where(bumped[cars], BUMP_PENALTY, 0.0)
+
+    rewards = sim._collide(car_pos, car_speed, cars)
+    assert bumped[cars].any()
+    assert np.allclose(car_pos, expected_pos)
+    assert np.allclose(car_speed, expected_speed)
+    assert np.array_equal(rewards, expected_rewards)
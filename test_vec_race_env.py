@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from race_env import CyberRacingEnv
+from vec_race_env import VectorCyberRacingEnv
+
+# Настройки
+NUM_CARS = 8
+STEPS = 1500
+
+
+def steer_to_checkpoint(vec, rng):
+    # Руль на следующий чекпоинт с шумом: машины проходят чекпоинты и круги, а не только бьются о стены
+    sim = vec.sim
+    target = vec.track.checkpoint_centers[(sim.current_checkpoint + 1) % len(vec.track.checkpoints)]
+    angle = np.arctan2(target[:, 1] - sim.car_pos[:, 1], target[:, 0] - sim.car_pos[:, 0])
+    turn = (angle - sim.car_angle + np.pi) % (2 * np.pi) - np.pi
+    actions = rng.uniform(-1, 1, (vec.num_envs, 2))
+    actions[:, 0] = np.clip(turn * 3, -1, 1) + 0.2 * actions[:, 0]
+    actions[:, 1] = 0.35 + 0.1 * actions[:, 1]
+    return actions.astype(np.float32)  # Как у PPO
+
+
+@pytest.mark.parametrize("lidar", ["field", "legacy"])
+def test_vec_matches_single_with_float32_actions(lidar):
+    vec = VectorCyberRacingEnv(NUM_CARS, lidar=lidar)
+    envs = [CyberRacingEnv(lidar=lidar) for _ in range(NUM_CARS)]
+    rng = np.random.default_rng(0)
+    obs = vec.reset()
+    assert np.array_equal(obs, np.stack([env.reset()[0] for env in envs]))
+
+    checkpoints = 0
+    for _ in range(STEPS):
+        actions = steer_to_checkpoint(vec, rng)
+        obs, rewards, dones, infos = vec.step(actions)
+        checkpoints += int(np.count_nonzero(rewards > 10))
+        for i, env in enumerate(envs):
+            single_obs, reward, terminated, _, _ = env.step(actions[i])
+            assert terminated == dones[i]
+            assert np.float32(reward) == rewards[i]
+            if terminated:
+                assert np.array_equal(infos[i]["terminal_observation"], single_obs)
+                single_obs, _ = env.reset()
+            assert np.array_equal(obs[i], single_obs)
+    assert checkpoints > 0
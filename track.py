@@ -0,0 +1,489 @@
+import math
+
+import numpy as np
+
+# Лидар: 7 лучей на 180 градусов, дальность 200 пикселей
+RAY_ANGLES = np.linspace(-np.pi / 2, np.pi / 2, 7)
+MAX_RAY_DIST = 200
+LEGACY_RAY_STEPS = np.arange(5, MAX_RAY_DIST, 10)  # Шаги старого raycast (по 10 пикселей)
+
+TRACK_SIZE = (1000, 800)  # Ширина и высота карты (совпадает с окном)
+TRACK_WIDTH = 140
+# Координаты точек трассы (сложная петля)
+TRACK_POINTS = [
+    (100, 150), (400, 100), (800, 150), # Верхняя прямая
+    (900, 400), (800, 700), # Правый поворот
+    (500, 700), (300, 500), # Петля в центре
+    (600, 400), (500, 250),
+    (200, 300), (100, 600), # Левый низ
+    (50, 400) # Возврат
+]
+CHECKPOINT_SIZE = 140
+
+
+def smooth_track_points(points, smoothness=30):
+    """Добавляет промежуточные точки для закругления углов трассы (Catmull-Rom сплайны)"""
+    if len(points) < 3:
+        return points
+
+    smoothed = []
+    n = len(points)
+
+    # Используем Catmull-Rom сплайны для гарантированной непрерывности
+    for i in range(n):
+        p0 = points[(i - 1) % n]  # Предыдущая точка
+        p1 = points[i]  # Текущая точка
+        p2 = points[(i + 1) % n]  # Следующая точка
+        p3 = points[(i + 2) % n]  # Следующая следующая точка
+
+        # Добавляем промежуточные точки между p1 и p2
+        # Пропускаем первую точку сегмента, чтобы избежать дублирования
+        start_j = 0 if i == 0 else 1
+        for j in range(start_j, smoothness + 1):
+            t = j / smoothness
+            # Catmull-Rom сплайн - гарантирует прохождение через p1 и p2
+            t2 = t * t
+            t3 = t2 * t
+
+            x = 0.5 * (2*p1[0] + (-p0[0] + p2[0])*t +
+                      (2*p0[0] - 5*p1[0] + 4*p2[0] - p3[0])*t2 +
+                      (-p0[0] + 3*p1[0] - 3*p2[0] + p3[0])*t3)
+            y = 0.5 * (2*p1[1] + (-p0[1] + p2[1])*t +
+                      (2*p0[1] - 5*p1[1] + 4*p2[1] - p3[1])*t2 +
+                      (-p0[1] + 3*p1[1] - 3*p2[1] + p3[1])*t3)
+            smoothed.append((int(x), int(y)))
+
+    return smoothed
+
+
+def draw_thick_line(mask, x1, y1, x2, y2, width):
+    """Толстая линия в булевой маске - пиксель в пиксель как pygame.draw.line(..., width).
+
+    Повторяет алгоритм pygame: линия идет по Брезенхему, а толщина набирается
+    горизонтальными (для крутых линий) или вертикальными отрезками, поэтому
+    маски, нарисованные раньше через pygame, совпадают с этими.
+    """
+    h, w = mask.shape
+    extra = 1 - (width % 2)
+    half = width // 2
+    xinc = abs(x1 - x2) <= abs(y1 - y2)  # Толщина по x (иначе по y)
+
+    if x1 == x2 and y1 == y2:
+        if 0 <= y1 < h:
+            mask[y1, max(x1 - half + extra, 0):min(w - 1, x1 + half) + 1] = True
+        return
+
+    dx = abs(x2 - x1)
+    sx = 1 if x1 < x2 else -1
+    dy = abs(y2 - y1)
+    sy = 1 if y1 < y2 else -1
+    err = dx // 2 if dx > dy else -(dy // 2)  # Деление как в C (к нулю)
+    while (y1 != y2 + sy) if xinc else (x1 != x2 + sx):
+        if xinc:
+            if 0 <= y1 < h:
+                mask[y1, max(x1 - half + extra, 0):min(w - 1, x1 + half) + 1] = True
+        elif 0 <= x1 < w:
+            mask[max(y1 - half + extra, 0):min(h - 1, y1 + half) + 1, x1] = True
+        e2 = err
+        if e2 > -dx:
+            err -= dy
+            x1 += sx
+        if e2 < dy:
+            err += dx
+            y1 += sy
+
+
+def draw_round_polyline(mask, points, width):
+    """Замкнутая толстая ломаная в булевой маске без щелей: закрашиваются пиксели,
+    чей центр не дальше width / 2 от ломаной (концы отрезков - круглые).
+
+    В отличие от draw_thick_line, на почти диагональных участках толщина не
+    проседает, поэтому так рисуются сгенерированные трассы (raster="round").
+    """
+    h, w = mask.shape
+    half = width / 2
+    points = np.asarray(points, dtype=np.float64)
+    for (x1, y1), (x2, y2) in zip(np.roll(points, 1, axis=0), points):
+        left, right = max(int(min(x1, x2) - half), 0), min(int(max(x1, x2) + half) + 1, w)
+        top, bottom = max(int(min(y1, y2) - half), 0), min(int(max(y1, y2) + half) + 1, h)
+        if left >= right or top >= bottom:
+            continue
+        ys, xs = np.ogrid[top:bottom, left:right]
+        dx, dy = x2 - x1, y2 - y1
+        length2 = dx * dx + dy * dy
+        # Ближайшая точка отрезка к центру пикселя
+        t = np.clip(((xs - x1) * dx + (ys - y1) * dy) / length2, 0.0, 1.0) if length2 > 0 else 0.0
+        ex, ey = xs - x1 - t * dx, ys - y1 - t * dy
+        mask[top:bottom, left:right] |= ex * ex + ey * ey <= half * half
+
+
+def default_checkpoints(points, size=CHECKPOINT_SIZE):
+    """Чекпоинты по умолчанию: квадраты size посередине каждого сегмента (x, y, w, h).
+
+    Координаты округляются к нулю, как в pygame.Rect.
+    """
+    points = [tuple(p) for p in points]
+    half = size / 2
+    return [(int((p1[0] + p2[0]) / 2 - half), int((p1[1] + p2[1]) / 2 - half), size, size)
+            for p1, p2 in zip(points, points[1:] + points[:1])]
+
+
+def checkpoint_gates(smoothed, centers, field, max_half=TRACK_WIDTH):
+    """Ворота чекпоинтов: отрезки поперек дороги, (K, 2, 2).
+
+    Ворота проходят через ближайшую к центру чекпоинта точку осевой линии
+    перпендикулярно ей и доходят до стен с обеих сторон (длина меряется
+    лучами по полю, так что на поворотах ворота перекрывают всю ширину дороги).
+    """
+    line = np.asarray(smoothed, dtype=np.float64)
+    n = len(line)
+    origins = np.empty((len(centers), 2))
+    normals = np.empty(len(centers))
+    for k, center in enumerate(centers):
+        i = int(np.argmin(((line - center) ** 2).sum(axis=1)))
+        tangent = line[(i + 1) % n] - line[i - 1]
+        origins[k] = line[i]
+        normals[k] = math.atan2(tangent[1], tangent[0]) + np.pi / 2
+    angles = np.stack([normals, normals + np.pi], axis=1)
+    # +1 пиксель, чтобы концы ворот были уже в стене
+    reach = field.cast_rays(origins, angles, max_half) + 1.0
+    gates = origins[:, None, :] + reach[:, :, None] * np.stack([np.cos(angles), np.sin(angles)], axis=2)
+    return gates
+
+
+def segments_cross(p1x, p1y, p2x, p2y, q1x, q1y, q2x, q2y):
+    """Пересекает ли отрезок p1 -> p2 отрезок q1 -> q2.
+
+    Только умножения и сравнения (без деления), поэтому работает одинаково и
+    для обычных float, и для массивов NumPy - и дает один и тот же результат.
+    """
+    dx = p2x - p1x
+    dy = p2y - p1y
+    ex = q2x - q1x
+    ey = q2y - q1y
+    wx = q1x - p1x
+    wy = q1y - p1y
+    denom = dx * ey - dy * ex
+    t_num = wx * ey - wy * ex  # Доля пути по p, умноженная на denom
+    u_num = wx * dy - wy * dx  # Доля пути по q, умноженная на denom
+    return ((denom != 0) & (t_num * denom >= 0) & (u_num * denom >= 0)
+            & (abs(t_num) <= abs(denom)) & (abs(u_num) <= abs(denom)))
+
+
+def _attach_shared(name):
+    # Открывает сегмент из TrackField.share, не регистрируя его в resource_tracker: сегментом
+    # владеет создатель. Воркеры делят с ним один resource_tracker, и их регистрация (или
+    # отмена) путает его учет - отсюда предупреждения об утечке и двойном unlink
+    from multiprocessing import resource_tracker, shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class Track:
+    """Геометрия трассы без pygame: сглаженная линия, маска с полем расстояний и чекпоинты.
+
+    field можно передать готовым (например, из общей памяти или из кэша трасс) -
+    тогда маска не рисуется. Так же можно передать уже сглаженную линию и чекпоинты.
+
+    raster - как рисуется дорога: "pygame" - draw_thick_line, пиксель в пиксель
+    как раньше (основная трасса, на ней обучены старые модели), "round" -
+    draw_round_polyline без щелей на диагоналях (сгенерированные трассы).
+    """
+
+    def __init__(self, points=TRACK_POINTS, width=TRACK_WIDTH, size=TRACK_SIZE, field=None,
+                 start_angle=0.0, checkpoints=None, smoothed=None, raster="pygame"):
+        if raster not in ("pygame", "round"):
+            raise ValueError(f"Неизвестная растеризация трассы: {raster}")
+        self.points = [tuple(p) for p in points]
+        self.width = width
+        self.raster = raster
+        self.size = tuple(size)
+        if smoothed is None:
+            smoothed = smooth_track_points(self.points, smoothness=30)
+        self.smoothed = [(int(x), int(y)) for x, y in smoothed]
+        # Старт - первая точка трассы, угол задается вместе с трассой
+        self.start_pos = (float(self.points[0][0]), float(self.points[0][1]))
+        self.start_angle = float(start_angle)
+
+        if field is None:
+            # Рисуем широкую дорогу с закругленными углами (замкнутая ломаная)
+            road = np.zeros((self.size[1], self.size[0]), dtype=bool)
+            if raster == "round":
+                draw_round_polyline(road, self.smoothed, width)
+            else:
+                for i in range(len(self.smoothed)):
+                    (x1, y1), (x2, y2) = self.smoothed[i - 1], self.smoothed[i]
+                    draw_thick_line(road, x1, y1, x2, y2, width)
+            field = TrackField(road)
+        self.field = field
+
+        if checkpoints is None:
+            checkpoints = default_checkpoints(self.points)
+        self.checkpoints = np.array(checkpoints, dtype=np.int64).reshape(-1, 4)
+        self.checkpoint_centers = (self.checkpoints[:, :2] + self.checkpoints[:, 2:] // 2).astype(np.float64)
+        # Те же чекпоинты как ворота поперек дороги (для проверки пересечением)
+        self.gates = checkpoint_gates(self.smoothed, self.checkpoint_centers, self.field, width)
+
+
+class TrackField:
+    """Трасса в виде массивов NumPy: маска стен и поле расстояний до ближайшей стены.
+
+    Маска и поле считаются один раз при создании, дальше все проверки
+    (стены под машиной, лидары) - это обращения к массивам.
+    """
+
+    # Точка внутри пикселя может быть ближе к стене, чем его центр, не больше чем на диагональ
+    CELL_DIAG = math.sqrt(2)
+    MAX_TRACE_ITER = 512
+    SCALAR_TRACE_RAYS = 32
+
+    def __init__(self, road):
+        # road[y, x] = True там, где асфальт
+        road = np.ascontiguousarray(road, dtype=bool)
+        self._set_arrays(~road, self._distance_transform(road))
+
+    @classmethod
+    def from_arrays(cls, wall, distance):
+        """Трасса из готовых массивов (например, загруженных из кэша через np.load(mmap_mode="r"))."""
+        field = cls.__new__(cls)
+        field._set_arrays(wall, distance)
+        return field
+
+    def _set_arrays(self, wall, distance):
+        self.wall = wall
+        self.distance = distance
+        self.height, self.width = wall.shape
+        # Для поштучной трассировки: индексирование memoryview дешевле, чем массива
+        self._distance_view = memoryview(distance.ravel())
+
+    def share(self):
+        """Копирует маску и поле в общую память, чтобы процессы-воркеры не строили их заново.
+
+        Возвращает (shm, handle): shm держит и в конце освобождает (close + unlink)
+        создатель, а handle - небольшой словарь, который передается в воркеры
+        и открывается там через TrackField.attach.
+        """
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(create=True, size=self.distance.nbytes + self.wall.nbytes)
+        distance = np.ndarray(self.distance.shape, self.distance.dtype, shm.buf)
+        wall = np.ndarray(self.wall.shape, bool, shm.buf, offset=self.distance.nbytes)
+        distance[:] = self.distance
+        wall[:] = self.wall
+        handle = {"name": shm.name, "shape": self.wall.shape, "dtype": self.distance.dtype.str}
+        return shm, handle
+
+    @classmethod
+    def attach(cls, handle):
+        """Трасса поверх общей памяти из TrackField.share (только чтение, без копирования)."""
+        shm = _attach_shared(handle["name"])
+        height, width = handle["shape"]
+        distance = np.ndarray((height + 2, width + 2), handle["dtype"], shm.buf)
+        wall = np.ndarray((height, width), bool, shm.buf, offset=distance.nbytes)
+        distance.flags.writeable = False
+        wall.flags.writeable = False
+
+        field = cls.__new__(cls)
+        field._set_arrays(wall, distance)
+        field._shm = shm  # Держим ссылку, пока живут массивы
+        return field
+
+    @staticmethod
+    def _distance_transform(road):
+        """Евклидово расстояние от центра каждого пикселя дороги до центра ближайшего пикселя стены.
+
+        Край экрана считается стеной, поэтому поле на 1 пиксель шире со всех сторон.
+        На стенах поле равно нулю.
+        """
+        import cv2
+
+        padded = np.pad(road.astype(np.uint8), 1)
+        return cv2.distanceTransform(padded, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+    def hits_wall(self, pos):
+        """Для каждой точки pos[i] = (x, y): True, если под ней стена или край экрана."""
+        cx = np.trunc(pos[:, 0]).astype(np.int64)
+        cy = np.trunc(pos[:, 1]).astype(np.int64)
+        hit = (cx < 0) | (cx >= self.width) | (cy < 0) | (cy >= self.height)
+        inside = ~hit
+        hit[inside] = self.wall[cy[inside], cx[inside]]
+        return hit
+
+    def hits_wall_along(self, start, end):
+        """Для каждого отрезка start[i] -> end[i]: True, если он задевает стену или край экрана.
+
+        Непрерывная проверка: в отличие от hits_wall по одной точке, машина не может
+        "проскочить" сквозь тонкую стену за большой шаг.
+        """
+        hit = self.hits_wall(end)
+        delta = end - start
+        length = np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+        moved = ~hit & (length > 0)
+        if moved.any():
+            m_len = length[moved]
+            dist = self._trace_rays(start[moved, 0], start[moved, 1],
+                                    delta[moved, 0] / m_len, delta[moved, 1] / m_len, m_len)
+            hit[moved] = dist < m_len
+        return hit
+
+    def segment_hits_wall(self, x0, y0, x1, y1):
+        """То же, что hits_wall_along, для одного отрезка на обычных float (для одиночной среды)."""
+        ix = int(x1)
+        iy = int(y1)
+        if not (0 <= ix < self.width and 0 <= iy < self.height) or self.wall[iy, ix]:
+            return True
+        dx = x1 - x0
+        dy = y1 - y0
+        length = math.sqrt(dx * dx + dy * dy)
+        if length == 0:
+            return False
+        return self._trace_ray(x0, y0, dx / length, dy / length, 0.0, 0.0, length) < length
+
+    def cast_rays(self, pos, angles, max_dist=MAX_RAY_DIST):
+        """Расстояния до стены вдоль лучей (sphere tracing по полю расстояний).
+
+        pos - (N, 2), angles - (N, R) абсолютные углы лучей. Возвращает (N, R).
+        max_dist - число или массив, совпадающий с angles по форме (своя дальность у каждого луча).
+        Вдали от стен луч прыгает сразу на расстояние до ближайшей стены, вблизи -
+        до следующей границы пикселя, поэтому ни один пиксель стены не пропускается,
+        а точка входа в стену считается точно (с точностью лучше пикселя).
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        ox = np.broadcast_to(pos[:, 0, None], angles.shape).ravel().astype(np.float64)
+        oy = np.broadcast_to(pos[:, 1, None], angles.shape).ravel().astype(np.float64)
+        max_d = np.broadcast_to(np.asarray(max_dist, dtype=np.float64), angles.shape).ravel()
+        hit_dist = self._trace_rays(ox, oy, np.cos(angles).ravel(), np.sin(angles).ravel(), max_d)
+        return hit_dist.reshape(angles.shape)
+
+    def _trace_rays(self, ox, oy, dx, dy, max_d):
+        # Трассировка плоских массивов лучей: начало (ox, oy), единичное направление (dx, dy),
+        # своя дальность max_d у каждого луча. Возвращает расстояния до стены
+
+        # Для одной машины накладные расходы NumPy на мелких массивах больше самой
+        # работы, поэтому лучи трассируются по одному
+        if ox.size <= self.SCALAR_TRACE_RAYS:
+            hit_dist = [
+                self._trace_ray(x, y, ray_dx, ray_dy, 0.0, 0.0, md)
+                for x, y, ray_dx, ray_dy, md in zip(ox.tolist(), oy.tolist(), dx.tolist(), dy.tolist(), max_d.tolist())
+            ]
+            return np.array(hit_dist)
+
+        # Направление к следующей границе пикселя и обратные компоненты луча
+        # (для луча вдоль оси вместо деления на ноль - очень маленький знаменатель)
+        bx = (dx >= 0).astype(np.float64)
+        by = (dy >= 0).astype(np.float64)
+        inv_x = 1.0 / np.where(dx != 0, dx, 1e-30)
+        inv_y = 1.0 / np.where(dy != 0, dy, 1e-30)
+
+        t = np.zeros(ox.size)
+        t_prev = np.zeros(ox.size)
+        hit_dist = max_d.copy()
+        d_flat = self.distance.ravel()
+        w2 = self.width + 2
+
+        # Пока активных лучей много, шагаем всеми сразу; оставшиеся (обычно лучи,
+        # скользящие вдоль стены) дотрассируем по одному
+        active = np.arange(ox.size)
+        for _ in range(self.MAX_TRACE_ITER):
+            if active.size <= self.SCALAR_TRACE_RAYS:
+                break
+            ta = t[active]
+            x = ox[active] + dx[active] * ta
+            y = oy[active] + dy[active] * ta
+            ix = np.minimum(np.maximum(x.astype(np.int64), -1), self.width)
+            iy = np.minimum(np.maximum(y.astype(np.int64), -1), self.height)
+            d = d_flat[iy * w2 + ix + (w2 + 1)].astype(np.float64)
+
+            hit = d == 0
+            if hit.any():
+                h = active[hit]
+                # Точка входа луча в найденный пиксель стены
+                entry = np.maximum((ix[hit] + (1.0 - bx[h]) - ox[h]) * inv_x[h],
+                                   (iy[hit] + (1.0 - by[h]) - oy[h]) * inv_y[h])
+                hit_dist[h] = np.minimum(np.maximum(entry, t_prev[h]), ta[hit])
+                keep = ~hit
+                active, ta, x, y, d = active[keep], ta[keep], x[keep], y[keep], d[keep]
+
+            # Шаг: до ближайшей стены или до выхода из текущего пикселя
+            a = active
+            exit_x = (np.floor(x) + bx[a] - x) * inv_x[a]
+            exit_y = (np.floor(y) + by[a] - y) * inv_y[a]
+            t_prev[a] = ta
+            t[a] = ta + np.maximum(d - self.CELL_DIAG, np.minimum(exit_x, exit_y)) + 1e-6
+            active = a[t[a] < max_d[a]]
+
+        for i in active.tolist():
+            hit_dist[i] = self._trace_ray(
+                float(ox[i]), float(oy[i]), float(dx[i]), float(dy[i]),
+                float(t[i]), float(t_prev[i]), float(max_d[i]),
+            )
+
+        return np.minimum(hit_dist, max_d)
+
+    def _trace_ray(self, ox, oy, dx, dy, t, t_prev, max_dist):
+        # Тот же алгоритм, что и в cast_rays, для одного луча на обычных float
+        # (арифметика совпадает операция в операцию, поэтому и результат тот же).
+        # min/max и floor заменены сравнениями - вызовы функций здесь самое дорогое
+        bx = 1.0 if dx >= 0 else 0.0
+        by = 1.0 if dy >= 0 else 0.0
+        inv_x = 1.0 / (dx if dx != 0 else 1e-30)
+        inv_y = 1.0 / (dy if dy != 0 else 1e-30)
+        d_flat = self._distance_view
+        w2 = self.width + 2
+        width, height = self.width, self.height
+        cell_diag = self.CELL_DIAG
+        for _ in range(self.MAX_TRACE_ITER):
+            if t >= max_dist:
+                return max_dist
+            x = ox + dx * t
+            y = oy + dy * t
+            ix = int(x)
+            iy = int(y)
+            if -1 <= ix <= width and -1 <= iy <= height:
+                d = d_flat[iy * w2 + ix + (w2 + 1)]
+            else:
+                # Далеко за краем экрана - там только рамка из стены
+                ix = min(max(ix, -1), width)
+                iy = min(max(iy, -1), height)
+                d = 0.0
+            if d == 0:
+                entry_x = (ix + (1.0 - bx) - ox) * inv_x
+                entry_y = (iy + (1.0 - by) - oy) * inv_y
+                entry = entry_x if entry_x > entry_y else entry_y
+                return t_prev if entry < t_prev else (t if entry > t else entry)
+            # floor через int: для отрицательных нецелых x int(x) на единицу больше
+            exit_x = (ix - (x < ix) + bx - x) * inv_x
+            exit_y = (iy - (y < iy) + by - y) * inv_y
+            step = exit_x if exit_x < exit_y else exit_y
+            if d - cell_diag > step:
+                step = d - cell_diag
+            t_prev = t
+            t = t + step + 1e-6
+        return min(t, max_dist)
+
+    def cast_rays_legacy(self, pos, angles, max_dist=MAX_RAY_DIST):
+        """Старый raycast: точки через каждые 10 пикселей, результат кратен шагу.
+
+        Дает те же показания, что и перебор пикселей через get_at, нужен для
+        моделей, обученных на старых лидарах.
+        """
+        steps = LEGACY_RAY_STEPS[LEGACY_RAY_STEPS < max_dist]
+        xs = np.trunc(pos[:, 0, None, None] + np.cos(angles)[:, :, None] * steps).astype(np.int64)
+        ys = np.trunc(pos[:, 1, None, None] + np.sin(angles)[:, :, None] * steps).astype(np.int64)
+
+        hit = (xs < 0) | (xs >= self.width) | (ys < 0) | (ys >= self.height)
+        inside = ~hit
+        hit[inside] = self.wall[ys[inside], xs[inside]]
+
+        # Первая точка попадания по лучу, иначе полная дальность
+        first = hit.argmax(axis=2)
+        return np.where(hit.any(axis=2), steps[first], max_dist).astype(np.float64)
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+
+from track import (Track, TrackField, TRACK_POINTS, TRACK_WIDTH, TRACK_SIZE, CHECKPOINT_SIZE,
+                   default_checkpoints, smooth_track_points)
+
+# Настройки
+TRACK_CACHE_DIR = "track_cache"  # Скомпилированные трассы (маска, поле расстояний, ...)
+CACHE_VERSION = 2                # Увеличить при изменении растеризации или формата кэша
+MAX_LOADED_TRACKS = 64           # Сколько открытых трасс держит TrackLibrary
+
+
+def track_spec(points, width=TRACK_WIDTH, size=TRACK_SIZE, start_angle=0.0, checkpoints=None, raster="pygame"):
+    """Описание трассы как данные: опорные точки, ширина, размер карты, угол старта, чекпоинты
+    и растеризация дороги (см. Track; в описаниях без нее - "pygame").
+
+    Все значения приводятся к простым типам, чтобы описание одинаково
+    сериализовалось в JSON и давало один и тот же хэш.
+    """
+    points = [(int(x), int(y)) for x, y in points]
+    if checkpoints is None:
+        checkpoints = default_checkpoints(points)
+    return {
+        "points": [list(p) for p in points],
+        "width": int(width),
+        "size": [int(size[0]), int(size[1])],
+        "start_angle": float(start_angle),
+        "checkpoints": [[int(v) for v in cp] for cp in checkpoints],
+        "raster": raster,
+    }
+
+
+DEFAULT_TRACK = track_spec(TRACK_POINTS)
+
+
+def track_key(spec):
+    """Хэш содержимого описания трассы - имя папки в кэше."""
+    data = json.dumps({"version": CACHE_VERSION, **spec}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def compile_track(spec):
+    """Сглаживание и растеризация трассы в памяти (то, что кэшируется на диске)."""
+    return Track(spec["points"], width=spec["width"], size=spec["size"],
+                 start_angle=spec["start_angle"], checkpoints=spec["checkpoints"],
+                 raster=spec.get("raster", "pygame"))
+
+
+def _save_track(track, spec, path):
+    # Пишем во временную папку и переименовываем: параллельные воркеры
+    # никогда не увидят наполовину записанную трассу
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, "wall.npy"), track.field.wall)
+    np.save(os.path.join(tmp, "distance.npy"), track.field.distance)
+    np.save(os.path.join(tmp, "smoothed.npy"), np.array(track.smoothed, dtype=np.int64))
+    with open(os.path.join(tmp, "spec.json"), "w") as f:
+        json.dump(spec, f)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Другой процесс успел раньше - его копия такая же
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_track(spec=DEFAULT_TRACK, cache_dir=TRACK_CACHE_DIR):
+    """Трасса из кэша: маска и поле открываются через mmap, без копирования в память процесса.
+
+    Если трассы в кэше нет, она компилируется и сохраняется. Если кэш записать
+    нельзя (например, папка только для чтения), трасса просто строится в памяти.
+    """
+    path = os.path.join(cache_dir, track_key(spec))
+    if not os.path.isdir(path):
+        track = compile_track(spec)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            _save_track(track, spec, path)
+        except OSError:
+            return track
+
+    field = TrackField.from_arrays(np.load(os.path.join(path, "wall.npy"), mmap_mode="r"),
+                                   np.load(os.path.join(path, "distance.npy"), mmap_mode="r"))
+    smoothed = np.load(os.path.join(path, "smoothed.npy")).tolist()
+    return Track(spec["points"], width=spec["width"], size=spec["size"], field=field,
+                 start_angle=spec["start_angle"], checkpoints=spec["checkpoints"], smoothed=smoothed,
+                 raster=spec.get("raster", "pygame"))
+
+
+def generate_track(seed, num_points=12, width=TRACK_WIDTH, size=TRACK_SIZE):
+    """Случайная замкнутая трасса по seed (одинаковый seed - одинаковая трасса).
+
+    Точки идут по кругу вокруг центра карты со случайным радиусом, поэтому
+    трасса не пересекает сама себя. Чекпоинты стоят на самой сглаженной линии
+    посередине каждого сегмента (на крутых поворотах середина хорды уходит с дороги).
+    Дорога рисуется без щелей (raster="round"): совместимость с pygame нужна только основной трассе.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = size
+    margin = width // 2 + 20  # Запас на ширину дороги и выпуклость сплайна
+    rx, ry = w / 2 - margin, h / 2 - margin
+
+    angles = (np.arange(num_points) + rng.uniform(-0.3, 0.3, num_points)) * (2 * np.pi / num_points)
+    radius = rng.uniform(0.45, 1.0, num_points)
+    xs = np.clip(w / 2 + rx * radius * np.cos(angles), margin, w - margin)
+    ys = np.clip(h / 2 + ry * radius * np.sin(angles), margin, h - margin)
+    points = [(int(x), int(y)) for x, y in zip(xs, ys)]
+
+    smoothed = smooth_track_points(points, smoothness=30)
+    half = CHECKPOINT_SIZE / 2
+    checkpoints = [(int(x - half), int(y - half), CHECKPOINT_SIZE, CHECKPOINT_SIZE)
+                   for x, y in (smoothed[30 * i + 15] for i in range(num_points))]
+
+    # Машина стартует в первой точке по касательной сплайна (Catmull-Rom: p[1] - p[-1])
+    start_angle = math.atan2(points[1][1] - points[-1][1], points[1][0] - points[-1][0])
+    return track_spec(points, width=width, size=size, start_angle=start_angle, checkpoints=checkpoints,
+                      raster="round")
+
+
+class TrackLibrary:
+    """Набор трасс для обучения: описания хранятся целиком, а сами трассы открываются из кэша по требованию.
+
+    Последние MAX_LOADED_TRACKS открытых трасс держатся в памяти, поэтому
+    повторный выбор трассы в reset ничего не стоит.
+    """
+
+    def __init__(self, specs, cache_dir=TRACK_CACHE_DIR, max_loaded=MAX_LOADED_TRACKS):
+        self.specs = list(specs)
+        self.cache_dir = cache_dir
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+
+    @classmethod
+    def generated(cls, num_tracks, first_seed=0, **kwargs):
+        """Библиотека из num_tracks случайных трасс с seed first_seed, first_seed + 1, ..."""
+        return cls([generate_track(seed) for seed in range(first_seed, first_seed + num_tracks)], **kwargs)
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __getitem__(self, index):
+        track = self._loaded.get(index)
+        if track is None:
+            track = load_track(self.specs[index], self.cache_dir)
+            self._loaded[index] = track
+            if len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        else:
+            self._loaded.move_to_end(index)
+        return track
+
+    def compile_all(self):
+        """Компилирует в кэш все трассы библиотеки (удобно сделать один раз до запуска воркеров)."""
+        for spec in self.specs:
+            if not os.path.isdir(os.path.join(self.cache_dir, track_key(spec))):
+                load_track(spec, self.cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Компиляция случайных трасс в кэш")
+    parser.add_argument("num_tracks", type=int, help="Сколько трасс сгенерировать")
+    parser.add_argument("--first-seed", type=int, default=0, help="Seed первой трассы")
+    parser.add_argument("--cache-dir", default=TRACK_CACHE_DIR, help="Папка кэша трасс")
+    args = parser.parse_args()
+
+    library = TrackLibrary.generated(args.num_tracks, args.first_seed, cache_dir=args.cache_dir)
+    library.compile_all()
+    print(f"Готово: {len(library)} трасс в {args.cache_dir}")
+
+if __name__ == "__main__":
+    main()
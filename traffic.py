@@ -0,0 +1,240 @@
+import math
+
+import numpy as np
+
+from race_core import RaceSim
+from track import MAX_RAY_DIST
+from vec_race_env import VectorCyberRacingEnv
+
+# Настройки
+CAR_RADIUS = 10.0      # Машина для столкновений и лидара - круг (квадрат машины 20x20)
+CELL_SIZE = 70.0       # Клетка пространственного хэша: столкновения - 3x3 клетки, лидар - 7x7
+BUMP_PENALTY = -5.0    # Штраф каждой машине за столкновение
+BUMP_SPEED = 0.5       # Скорость после столкновения (доля от прежней)
+GRID_ROW_GAP = 30.0    # Стартовая решетка: расстояние между рядами
+GRID_LANE_GAP = 40.0   # и между машинами в ряду
+CARS_PER_RACE = 16     # Машин в одном заезде TrafficRacingEnv (заезды пачки друг друга не видят)
+
+
+class SpatialHash:
+    """Равномерная сетка для поиска соседей: объекты раскладываются по клеткам сортировкой.
+
+    build() перестраивает сетку по текущим позициям (раз в тик), query()
+    возвращает кандидатов - объекты из клеток рядом с точками запроса.
+    Кандидатов проверяют точно уже снаружи, так что стоимость растет с числом
+    машин рядом, а не со всеми парами машин. Слои (layers) - независимые сетки
+    в одном массиве: объекты из разных слоев соседями не бывают.
+    """
+
+    def __init__(self, size, cell_size=CELL_SIZE, layers=1):
+        self.cell_size = cell_size
+        self.cols = int(size[0] // cell_size) + 1
+        self.rows = int(size[1] // cell_size) + 1
+        self.layers = layers
+        self.items = np.zeros(0, dtype=np.int64)
+        self.cell_start = np.zeros(layers * self.cols * self.rows + 1, dtype=np.int64)
+
+    def _cells(self, points):
+        # Клетка точки; точки за краем карты - в крайних клетках (соседство при этом не теряется)
+        cx = np.clip(np.floor(points[:, 0] / self.cell_size), 0, self.cols - 1).astype(np.int64)
+        cy = np.clip(np.floor(points[:, 1] / self.cell_size), 0, self.rows - 1).astype(np.int64)
+        return cx, cy
+
+    def build(self, points, items=None, layer=0):
+        """Раскладывает объекты items (номера, по умолчанию все) с позициями points[items] по клеткам.
+        layer - слой каждого объекта (число или массив по items)."""
+        if items is None:
+            items = np.arange(len(points))
+        cx, cy = self._cells(points[items])
+        keys = (layer * self.rows + cy) * self.cols + cx
+        order = np.argsort(keys, kind="stable")
+        self.items = items[order]
+        # Объекты клетки c - items[cell_start[c]:cell_start[c + 1]]
+        self.cell_start = np.searchsorted(keys[order], np.arange(self.layers * self.cols * self.rows + 1))
+
+    def query(self, points, radius, layer=0):
+        """Кандидаты рядом с точками: (номер точки, номер объекта) для всех объектов того же слоя
+        в клетках, которые задевает квадрат +-radius вокруг точки. Каждая пара - ровно один раз."""
+        reach = int(math.ceil(radius / self.cell_size))
+        cx, cy = self._cells(points)
+        offsets = np.arange(-reach, reach + 1)
+        x = (cx[:, None] + offsets[None, :])[:, None, :]
+        y = (cy[:, None] + offsets[None, :])[:, :, None]
+        base = np.broadcast_to(np.asarray(layer) * self.rows, cx.shape)[:, None, None]
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        owners, _, _ = np.nonzero(inside)
+        cells = ((base + y) * self.cols + x)[inside]
+
+        # Разворачиваем диапазоны клеток в пары без цикла по точкам
+        start = self.cell_start[cells]
+        count = self.cell_start[cells + 1] - start
+        total = int(count.sum())
+        first = np.repeat(np.cumsum(count) - count, count)
+        slots = np.repeat(start, count) + np.arange(total) - first
+        return np.repeat(owners, count), self.items[slots]
+
+
+def start_grid(track):
+    """Места на стартовой решетке: ряды вперед и назад от старта, по три машины в ряду.
+
+    Годятся только места на дороге, не ближе CAR_RADIUS к стене и не в квадрате
+    первого чекпоинта. Первое место - сам старт.
+    """
+    heading = np.array([math.cos(track.start_angle), math.sin(track.start_angle)])
+    side = np.array([-heading[1], heading[0]])
+    cp = track.checkpoints[1 % len(track.checkpoints)]
+    rows = [0] + [sign * k for k in range(1, 20) for sign in (1, -1)]
+    slots = []
+    for row in rows:
+        for lane in (0, -1, 1):
+            pos = np.array(track.start_pos) + heading * row * GRID_ROW_GAP + side * lane * GRID_LANE_GAP
+            x, y = int(pos[0]), int(pos[1])
+            if not (0 <= x < track.field.width and 0 <= y < track.field.height):
+                continue
+            if track.field.distance[y, x] < CAR_RADIUS * 1.5:
+                continue
+            # Квадрат машины не должен задевать следующий чекпоинт - иначе он засчитается сразу
+            car_x, car_y = math.trunc(pos[0] - 10), math.trunc(pos[1] - 10)
+            if car_x < cp[0] + cp[2] and car_x + 20 > cp[0] and car_y < cp[1] + cp[3] and car_y + 20 > cp[1]:
+                continue
+            slots.append(pos)
+    return np.array(slots)
+
+
+class TrafficSim(RaceSim):
+    """RaceSim, в котором машины видят и толкают друг друга.
+
+    Наблюдение - 9 значений RaceSim и еще 7 лучей лидара по машинам (те же
+    углы; 1 - машины нет или она за стеной). Машины - круги радиуса CAR_RADIUS:
+    пересекшиеся расталкиваются, теряют скорость и получают штраф BUMP_PENALTY.
+    Соседи и лучи ищутся через SpatialHash, перестраиваемый каждый тик.
+    Со старта машины встают на стартовую решетку (start_grid), а не в одну точку.
+    Машины с active=False убраны с трассы: их не видно и с ними не сталкиваются.
+
+    cars_per_race делит машины на заезды по порядку номеров: заезды идут на одной
+    трассе одновременно, но друг друга не видят (по умолчанию заезд один).
+    """
+
+    def __init__(self, track, num_cars=1, lidar="field", action_repeat=1, swept=None, stats=False,
+                 params=None, cars_per_race=None):
+        self.cars_per_race = cars_per_race or num_cars
+        self.race = np.arange(num_cars) // self.cars_per_race
+        self.slots = start_grid(track)
+        self.hash = SpatialHash(track.size, layers=int(self.race[-1]) + 1 if num_cars else 1)
+        self.active = np.ones(num_cars, dtype=bool)
+        super().__init__(track, num_cars=num_cars, lidar=lidar, action_repeat=action_repeat,
+                         swept=swept, stats=stats, params=params)
+        self.obs_size += len(self.ray_angles)
+
+    def _place_at_start(self, mask):
+        super()._place_at_start(mask)
+        cars = np.flatnonzero(mask)
+        self.car_pos[cars] = self.slots[cars % self.cars_per_race % len(self.slots)]
+        self.prev_pos[cars] = self.car_pos[cars]
+
+    def _collide(self, car_pos, car_speed, cars):
+        # Позиции всех машин на этом тике (машины не из cars в этом тике стоят)
+        pos = self.car_pos.copy()
+        pos[cars] = car_pos
+        present = np.flatnonzero(self.active)
+        self.hash.build(pos, present, self.race[present])
+        a, b = self.hash.query(pos[present], 2 * CAR_RADIUS, self.race[present])
+        a = present[a]
+        pair = a < b
+        a, b = a[pair], b[pair]
+        delta = pos[b] - pos[a]
+        dist = np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+        touching = dist < 2 * CAR_RADIUS
+        n = len(car_pos)
+        rewards = np.zeros(n)
+        if not touching.any():
+            return rewards
+
+        a, b, delta, dist = a[touching], b[touching], delta[touching], dist[touching]
+        # Расталкиваем вдоль линии центров; машина, которая на этом тике не едет, не сдвигается
+        normal = np.where(dist[:, None] > 0, delta / np.where(dist > 0, dist, 1.0)[:, None], [1.0, 0.0])
+        moving = np.zeros(self.num_cars, dtype=bool)
+        moving[cars] = True
+        share_a = np.where(moving[b], 0.5, 1.0) * moving[a]
+        share_b = np.where(moving[a], 0.5, 1.0) * moving[b]
+        overlap = (2 * CAR_RADIUS - dist)[:, None] * normal
+        push = np.zeros((self.num_cars, 2))
+        np.add.at(push, a, -overlap * share_a[:, None])
+        np.add.at(push, b, overlap * share_b[:, None])
+        bumped = np.zeros(self.num_cars, dtype=bool)
+        bumped[a] = True
+        bumped[b] = True
+
+        # Назад к машинам этого тика (cars - срез или номера, как в RaceSim._tick)
+        car_pos += push[cars]
+        hit = bumped[cars]
+        car_speed[hit] *= BUMP_SPEED
+        rewards[hit] = BUMP_PENALTY
+        return rewards
+
+    def observe(self, cars=slice(None)):
+        own = super().observe(cars)
+        rays = len(self.ray_angles)
+        obs = np.empty((len(own), self.obs_size), dtype=np.float32)
+        obs[:, :own.shape[1]] = own
+        stats = self.stats
+        if stats is not None:
+            stats.mark()
+        car_dist = self.cast_car_rays(cars) / MAX_RAY_DIST
+        # Машина за стеной не видна
+        wall = obs[:, :rays]
+        obs[:, own.shape[1]:] = np.where(car_dist < wall, car_dist, 1.0)
+        if stats is not None:
+            stats.lap("lidar")
+        return obs
+
+    def cast_car_rays(self, cars=slice(None)):
+        """Расстояния (N, лучей) по лучам лидара машин cars до ближайшей другой машины (MAX_RAY_DIST, если нет)."""
+        origins = self.car_pos[cars]
+        owner = np.arange(self.num_cars)[cars]
+        angles = self.car_angle[cars][:, None] + self.ray_angles[None, :]
+        dist = np.full(angles.shape, float(MAX_RAY_DIST))
+        present = np.flatnonzero(self.active)
+        if present.size < 2 or not len(origins):
+            return dist
+
+        # Кандидаты - машины своего заезда в клетках в пределах дальности лидара
+        self.hash.build(self.car_pos, present, self.race[present])
+        origin, car = self.hash.query(origins, MAX_RAY_DIST + CAR_RADIUS, self.race[owner])
+        other = car != owner[origin]
+        origin, car = origin[other], car[other]
+        rel = self.car_pos[car] - origins[origin]
+        near = rel[:, 0] * rel[:, 0] + rel[:, 1] * rel[:, 1] <= (MAX_RAY_DIST + CAR_RADIUS) ** 2
+        origin, rel = origin[near], rel[near]
+
+        # Луч против круга для всех 7 лучей кандидата: ближайшая точка входа впереди начала луча
+        dx, dy = np.cos(angles[origin]), np.sin(angles[origin])
+        along = rel[:, 0, None] * dx + rel[:, 1, None] * dy
+        perp2 = (rel[:, 0] * rel[:, 0] + rel[:, 1] * rel[:, 1])[:, None] - along * along
+        half = np.sqrt(np.maximum(CAR_RADIUS * CAR_RADIUS - perp2, 0.0))
+        hit = (perp2 <= CAR_RADIUS * CAR_RADIUS) & (along + half >= 0)
+        ray = origin[:, None] * angles.shape[1] + np.arange(angles.shape[1])
+        flat = dist.ravel()
+        np.minimum.at(flat, ray[hit], np.maximum(along - half, 0.0)[hit])
+        return np.minimum(flat.reshape(angles.shape), MAX_RAY_DIST)
+
+
+class TrafficRacingEnv(VectorCyberRacingEnv):
+    """Пачка машин в потоке (VecEnv): каждая машина - своя среда.
+
+    Все машины ведет одна политика (общие веса), как в VectorCyberRacingEnv,
+    но машины мешают друг другу (TrafficSim). Наблюдение - 16 значений.
+    Пачка делится на заезды по cars_per_race машин, которые идут в одном
+    TrafficSim, но друг друга не видят: большая пачка не забивает одну трассу.
+    Завершившая эпизод машина встает на свое место стартовой решетки.
+    """
+
+    def __init__(self, num_envs=64, cars_per_race=CARS_PER_RACE, **kwargs):
+        self.cars_per_race = cars_per_race
+        super().__init__(num_envs, **kwargs)
+
+    def _make_sim(self, track, **kwargs):
+        return TrafficSim(track, cars_per_race=self.cars_per_race, **kwargs)
+
+    def _reset_obs(self, mask):
+        return self.sim.observe(np.flatnonzero(mask))
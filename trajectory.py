@@ -0,0 +1,139 @@
+import json
+import os
+
+import numpy as np
+
+from race_core import END_CAUSES
+from track_library import load_track, track_spec
+
+# Настройки
+RECORD_BUFFER = 4096  # Записей в буфере до сброса на диск
+TRAJECTORY_VERSION = 1
+
+# Одна запись - один шаг среды (состояние после шага), 34 байта
+RECORD_DTYPE = np.dtype([
+    ("x", "<f4"), ("y", "<f4"), ("angle", "<f4"), ("speed", "<f4"),
+    ("steering", "<f4"), ("throttle", "<f4"), ("reward", "<f4"),
+    ("checkpoint", "<u2"), ("laps", "u1"),
+    ("flags", "u1"),   # Бит 0 - эпизод завершен, биты 1-3 - причина (номер в END_CAUSES + 1)
+    ("track", "<u2"),  # Номер трассы в описании лога
+])
+TERMINATED = 1
+CAUSE_CODES = {cause: (i + 1) << 1 for i, cause in enumerate(END_CAUSES)}
+
+
+class TrajectoryWriter:
+    """Потоковая запись шагов среды в бинарный лог фиксированной ширины.
+
+    Записи копятся в заранее выделенном массиве и сбрасываются в файл
+    пачками по RECORD_BUFFER. Рядом с логом лежит <путь>.json с форматом
+    записи и описаниями трасс (по ним реплей открывает трассы из кэша).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "wb")
+        self._buffer = np.zeros(RECORD_BUFFER, dtype=RECORD_DTYPE)
+        self._count = 0
+        self._tracks = []      # Описания трасс (track_spec)
+        self._track = None     # Последняя трасса и ее номер - трасса меняется только в reset
+        self._track_index = 0
+        self._write_meta()
+
+    def add(self, env, steering, throttle, reward, terminated):
+        """Запись состояния env после шага."""
+        if env.track is not self._track:
+            self._set_track(env.track)
+        flags = TERMINATED | CAUSE_CODES[env.end_cause] if terminated else 0
+        pos, angle, speed, checkpoint = env.car_pos, env.car_angle, env.car_speed, env.current_checkpoint
+        if terminated and env.end_cause == "wrong_way":
+            # Среда уже вернула машину на старт - пишем, где она поехала не туда
+            pos, angle, speed, checkpoint = env.wrong_way_state
+        self._buffer[self._count] = (pos[0], pos[1], angle, speed, steering, throttle, reward, checkpoint, env.laps,
+                                     flags, self._track_index)
+        self._count += 1
+        if self._count == RECORD_BUFFER:
+            self.flush()
+
+    def _set_track(self, track):
+        spec = track_spec(track.points, track.width, track.size, track.start_angle, track.checkpoints, track.raster)
+        if spec in self._tracks:
+            self._track_index = self._tracks.index(spec)
+        else:
+            self._tracks.append(spec)
+            self._track_index = len(self._tracks) - 1
+            self._write_meta()
+        self._track = track
+
+    def _write_meta(self):
+        meta = {"version": TRAJECTORY_VERSION, "dtype": RECORD_DTYPE.descr,
+                "end_causes": list(END_CAUSES), "tracks": self._tracks}
+        tmp = f"{self.path}.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, f"{self.path}.json")
+
+    def flush(self):
+        self._buffer[:self._count].tofile(self._file)
+        self._file.flush()
+        self._count = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+class Trajectory:
+    """Лог траектории, открытый через mmap: записи не читаются в память целиком.
+
+    records - структурированный массив RECORD_DTYPE, episodes - (start, end)
+    для каждого эпизода (последний может быть незаконченным).
+    """
+
+    def __init__(self, path):
+        with open(f"{path}.json") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != TRAJECTORY_VERSION:
+            raise ValueError(f"Неизвестная версия лога: {self.meta['version']}")
+        self.path = path
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+        ends = np.flatnonzero(self.records["flags"] & TERMINATED) + 1
+        if not len(ends) or ends[-1] != count:
+            ends = np.append(ends, count)
+        starts = np.concatenate([[0], ends[:-1]])
+        self.episodes = np.stack([starts, ends], axis=1)[ends > starts]
+        self._tracks = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def episode_of(self, index):
+        """Номер эпизода, в котором запись index."""
+        return int(np.searchsorted(self.episodes[:, 1], index, side="right"))
+
+    def end_cause(self, episode):
+        """Причина завершения эпизода (None, если лог оборвался посреди эпизода)."""
+        flags = int(self.records["flags"][self.episodes[episode, 1] - 1])
+        if not flags & TERMINATED:
+            return None
+        return self.meta["end_causes"][(flags >> 1) - 1]
+
+    def find(self, cause):
+        """Номера эпизодов, закончившихся причиной cause."""
+        last = self.records["flags"][self.episodes[:, 1] - 1]
+        return np.flatnonzero(last == (TERMINATED | CAUSE_CODES[cause]))
+
+    def track(self, index):
+        """Трасса записи из кэша трасс."""
+        number = int(self.records["track"][index])
+        if number not in self._tracks:
+            self._tracks[number] = load_track(self.meta["tracks"][number])
+        return self._tracks[number]
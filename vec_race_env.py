@@ -0,0 +1,147 @@
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+
+from race_core import RaceSim, MAX_STEPS
+from track import Track
+from track_library import load_track
+
+
+class VectorCyberRacingEnv(VecEnv):
+    """Пачка из N машин, которые шагают одним вызовом (интерфейс VecEnv из Stable-Baselines3).
+
+    Физика, проверка направления, стен, чекпоинтов и лидары считаются векторно
+    в race_core.RaceSim - том же ядре, что и у CyberRacingEnv, поэтому награды,
+    условия завершения и наблюдения совпадают. pygame не нужен.
+    """
+
+    def __init__(self, num_envs=64, lidar="field", field=None, track=None, action_repeat=1, swept=None,
+                 stats=False, start_states=None, start_state_prob=0.5, params=None):
+        self.render_mode = None
+
+        # Трасса одна на все машины: готовая, на общем поле или из кэша трасс
+        if track is None:
+            track = Track(field=field) if field is not None else load_track()
+        self.track = track
+        self.field = self.track.field
+        self.lidar = lidar
+        self.sim = self._make_sim(self.track, num_cars=num_envs, lidar=lidar,
+                                  action_repeat=action_repeat, swept=swept, stats=stats, params=params)
+
+        observation_space = spaces.Box(low=0, high=1, shape=(self.sim.obs_size,), dtype=np.float32)
+        action_space = spaces.Box(low=np.array([-1, -1]), high=np.array([1, 1]), dtype=np.float32)
+        super().__init__(num_envs, observation_space, action_space)
+
+        self._actions = np.zeros((num_envs, 2))
+        # Старты с чекпоинтов (race_core.StartStateBuffer), как в CyberRacingEnv
+        self.start_states = start_states
+        self.start_state_prob = start_state_prob
+        self.np_random = np.random.default_rng()
+        # Наблюдение на старте одинаковое для всех машин, считаем его один раз
+        self._start_obs = self.sim.observe()[0]
+        if self.sim.stats is not None:
+            self.sim.stats.clear()
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.np_random = np.random.default_rng(self._seeds[0])
+        self.sim.reset()
+        self._reset_seeds()
+        self._reset_options()
+        obs = np.empty((self.num_envs, self.sim.obs_size), dtype=np.float32)
+        obs[:] = self._reset_obs(np.ones(self.num_envs, dtype=bool))
+        if self.start_states is not None:
+            self._curriculum_starts(np.ones(self.num_envs, dtype=bool), obs)
+        return obs
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.float64).reshape(self.num_envs, 2)
+
+    def step_wait(self):
+        if self.start_states is not None:
+            checkpoints = self.sim.current_checkpoint.copy()
+            laps = self.sim.laps.copy()
+        rewards, dones = self.sim.step(self._actions)
+        obs = self.sim.observe()
+        if self.start_states is not None:
+            # Снимки на новых чекпоинтах; аварии (завершение не кругом и не по тайм-ауту) -
+            # в вес чекпоинта, после которого случились
+            reached = np.flatnonzero(~dones & (self.sim.current_checkpoint != checkpoints))
+            if reached.size:
+                self.start_states.add(self.sim.get_state(reached))
+            failed = dones & (self.sim.laps == laps) & (self.sim.steps <= MAX_STEPS)
+            if failed.any():
+                self.start_states.add_failures(checkpoints[failed])
+
+        # Автосброс завершившихся машин
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = obs[i].copy()
+            infos[i]["TimeLimit.truncated"] = False
+        if dones.any():
+            self.sim.reset(dones)
+            obs[dones] = self._reset_obs(dones)
+            if self.start_states is not None:
+                self._curriculum_starts(dones, obs)
+
+        return obs, rewards.astype(np.float32), dones, infos
+
+    def _make_sim(self, track, **kwargs):
+        # Ядро симуляции (в traffic.TrafficRacingEnv - TrafficSim)
+        return RaceSim(track, **kwargs)
+
+    def _reset_obs(self, mask):
+        # Наблюдения машин mask, только что поставленных на старт
+        return self._start_obs
+
+    def _curriculum_starts(self, mask, obs):
+        # Часть машин из mask стартует из снимков буфера
+        if not len(self.start_states):
+            return
+        cars = np.flatnonzero(mask)
+        cars = cars[self.np_random.random(cars.size) < self.start_state_prob]
+        if cars.size:
+            self.sim.set_state(self.start_states.sample(self.np_random, cars.size), cars)
+            obs[cars] = self.sim.observe(cars)
+
+    def get_state(self, indices=None):
+        """Снимки машин (массив race_core.STATE_DTYPE), по умолчанию всех."""
+        return self.sim.get_state(self._get_indices(indices))
+
+    def set_state(self, states, indices=None):
+        """Восстанавливает машины из снимков и возвращает их наблюдения."""
+        cars = self._get_indices(indices)
+        self.sim.set_state(states, cars)
+        return self.sim.observe(cars)
+
+    def close(self):
+        pass
+
+    def pop_stats(self):
+        """Статистика всей пачки с прошлого вызова (для RaceStatsCallback); без stats=True - пустой словарь."""
+        if self.sim.stats is None:
+            return {}
+        return self.sim.stats.pop()
+
+    def _check_all(self, indices, what):
+        # Все машины пачки - один объект среды: атрибут у них общий, метод вызывается один раз
+        # на всю пачку, поэтому поменять атрибут или вызвать метод только для части машин нельзя
+        if indices is not None and sorted(self._get_indices(indices)) != list(range(self.num_envs)):
+            raise ValueError(f"{what} действует на всю пачку сразу, indices задавать нельзя "
+                             "(для части машин - get_state/set_state)")
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * len(self._get_indices(indices))
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._check_all(indices, "set_attr")
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        """Вызывает метод один раз и возвращает его результат для каждой машины."""
+        self._check_all(indices, "env_method")
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result] * self.num_envs
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * len(self._get_indices(indices))